@@ -1,6 +1,9 @@
+import asyncio
 import DFW
 import pysnmp.hlapi
+import pysnmp.hlapi.asyncio
 import sys
+import threading
 
 # -------------------------------------------------------------------------
 # Methods for communicating with the 1-Wire Environmental Sensor
@@ -18,6 +21,10 @@ class Commands:
         # Cache the pysnmp info instead of creating it every call
         self.snmp_builder = None
         self.snmp_engine = pysnmp.hlapi.SnmpEngine()
+        self.read_auth = pysnmp.hlapi.CommunityData(read, mpModel=0)
+        self.read_transport = pysnmp.hlapi.UdpTransportTarget((host, 161), timeout=1, retries=1)
+        self.context = pysnmp.hlapi.ContextData()
+        self.async_transport = pysnmp.hlapi.asyncio.UdpTransportTarget((host, 161), timeout=1, retries=1)
         
     def getSNMP(self, oid):
         
@@ -59,6 +66,65 @@ class Commands:
                 
         return result, error_indication, error_status
     
+    async def getSNMPMany(self, engine, oids):
+        """ Fetch several OIDs in a single GET PDU on the asyncio engine,
+            reusing the cached community, transport and context. Returns a
+            dictionary of oid: string value, with None for any value the
+            agent could not supply, plus the error indication and status.
+        """
+        
+        objects = [pysnmp.hlapi.ObjectType(pysnmp.hlapi.ObjectIdentity(oid)) for oid in oids]
+        
+        results = dict.fromkeys(oids)
+        error_indication = None
+        error_status = 0
+        
+        try:
+            error_indication, error_status, _error_index, var_binds = \
+                await pysnmp.hlapi.asyncio.getCmd(engine, self.read_auth, self.async_transport,
+                                                  self.context, *objects, lookupMib=False)
+        except pysnmp.error.PySnmpError:
+            exception = sys.exc_info()[1]
+            error_indication = str(exception)
+            return results, error_indication, error_status
+        
+        if error_indication is not None or error_status != 0:
+            return results, error_indication, error_status
+        
+        # Var binds come back in the order they were requested.
+        for oid, var_bind in zip(oids, var_binds):
+            value = var_bind[1]
+            if isinstance(value, (pysnmp.proto.rfc1905.NoSuchObject,
+                                  pysnmp.proto.rfc1905.NoSuchInstance,
+                                  pysnmp.proto.rfc1905.EndOfMibView)):
+                continue
+            results[oid] = str(value)
+        
+        return results, error_indication, error_status
+    
+    def walkSNMP(self, oid):
+        """ Walk the subtree rooted at oid with GETNEXT requests. Returns
+            a list of (oid, string value) pairs, empty if the walk fails.
+        """
+        
+        identity = pysnmp.hlapi.ObjectType(pysnmp.hlapi.ObjectIdentity(oid))
+        walker = pysnmp.hlapi.nextCmd(self.snmp_engine, self.read_auth, self.read_transport,
+                                      self.context, identity, lookupMib=False,
+                                      lexicographicMode=False)
+        
+        rows = list()
+        
+        try:
+            for error_indication, error_status, _error_index, var_binds in walker:
+                if error_indication is not None or error_status != 0:
+                    break
+                for var_bind in var_binds:
+                    rows.append(('.' + str(var_bind[0]).lstrip('.'), str(var_bind[1])))
+        except pysnmp.error.PySnmpError:
+            pass
+        
+        return rows
+    
     def setSNMP(self, oid, value):
         
         host = self.snmp_host
@@ -99,6 +165,180 @@ class Commands:
     
 # end of class Commands
 
+class Host:
+    """ One OWENV unit: its SNMP commands, the keywords it feeds, and a
+        count of consecutive failed polls.
+    """
+    
+    def __init__(self, poller, number, commands):
+        
+        self.poller = poller
+        self.number = number
+        self.snmp = commands
+        self.prefix = "OWENV%d" % (number)
+        
+        self.keywords = dict()
+        self.values = dict()
+        
+        self.failures = 0
+        self.online = None
+        self.fails_keyword = None
+        
+    def register(self, keyword):
+        
+        self.keywords[keyword.oid] = keyword
+        
+    def cached(self, oid):
+        
+        return self.values.get(oid)
+    
+    def trigger(self):
+        
+        self.poller.trigger()
+        
+    async def poll(self, engine, timeout):
+        
+        oids = list(self.keywords.keys())
+        if len(oids) == 0:
+            return
+        
+        try:
+            results, _error_indication, _error_status = \
+                await asyncio.wait_for(self.snmp.getSNMPMany(engine, oids), timeout)
+        except asyncio.TimeoutError:
+            results = dict.fromkeys(oids)
+        
+        self.values = results
+        
+        if any(value is not None for value in results.values()):
+            self.failures = 0
+        else:
+            self.failures += 1
+        
+        self.reportFailures()
+        
+        # One bad keyword must not keep the rest of the unit from updating.
+        for oid, value in results.items():
+            if value is None or value == '':
+                continue
+            
+            keyword = self.keywords[oid]
+            try:
+                keyword.set(value)
+            except Exception:
+                exception = sys.exc_info()[1]
+                print("OWENV: could not set %s to %r: %s" % (keyword.name, value, exception))
+                
+    def reportFailures(self):
+        
+        if self.fails_keyword is None:
+            return
+        
+        try:
+            self.fails_keyword.set(str(self.failures))
+        except Exception:
+            exception = sys.exc_info()[1]
+            print("OWENV: could not set %s: %s" % (self.fails_keyword.name, exception))
+
+# end of class Host
+
+class BulkPoller:
+    """ Poll every OWENV host from one asyncio event loop. Each cycle sends
+        one GET per host, all concurrently, so adding a host adds neither a
+        thread nor time to the cycle. A host is considered offline after
+        failure_threshold consecutive failed polls.
+    """
+    
+    def __init__(self, owenv, period=2, timeout=3, failure_threshold=6):
+        
+        self.owenv = owenv
+        self.period = period
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        
+        self.hosts = list()
+        
+        self.loop = None
+        self.wakeup = None
+        self.shutdown = threading.Event()
+        self.thread = None
+        
+    def addHost(self, commands):
+        
+        host = Host(self, len(self.hosts) + 1, commands)
+        self.hosts.append(host)
+        return host
+    
+    def trigger(self):
+        ''' Poll now instead of waiting out the rest of the period.
+        '''
+        if self.loop is not None and self.wakeup is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+            
+    def start(self):
+        
+        if self.thread is not None:
+            return
+        
+        self.thread = threading.Thread(target=self.run, name='OWENV poller')
+        self.thread.daemon = True
+        self.thread.start()
+        
+    def stop(self):
+        
+        self.shutdown.set()
+        self.trigger()
+        
+    def run(self):
+        
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        
+        try:
+            self.loop.run_until_complete(self.cycle())
+        finally:
+            self.loop.close()
+            
+    async def cycle(self):
+        
+        self.wakeup = asyncio.Event()
+        engine = pysnmp.hlapi.asyncio.SnmpEngine()
+        
+        while self.shutdown.is_set() == False:
+            polls = [host.poll(engine, self.timeout) for host in self.hosts]
+            
+            outcomes = await asyncio.gather(*polls, return_exceptions=True)
+            for host, outcome in zip(self.hosts, outcomes):
+                if isinstance(outcome, Exception):
+                    host.failures += 1
+                    host.reportFailures()
+                    print("OWENV poll of %s failed: %s" % (host.snmp.snmp_host, outcome))
+            
+            self.updateStatus()
+            
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.period)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            
+    def updateStatus(self):
+        
+        online = True
+        
+        for host in self.hosts:
+            host_online = host.failures < self.failure_threshold
+            # Only report transitions, and not a unit coming up at startup.
+            if host_online != host.online and (host.online is not None or not host_online):
+                state = 'online' if host_online else 'offline'
+                print("OWENV host %s is %s" % (host.snmp.snmp_host, state))
+            host.online = host_online
+            online = online and host_online
+            
+        self.owenv.reportStatus(online)
+
+# end of class BulkPoller
+
 # Converting string to int does not work for some reason
 class Integer(DFW.Keyword.Integer):
 
@@ -200,20 +440,33 @@ class Integer(DFW.Keyword.Integer):
 
 class Double(DFW.Keyword.Double):
 
-    def __init__(self, name, service, owenv, oid, period=30):
+    def __init__(self, name, service, owenv, oid, period=30, poller=None):
 
         self.owenv = owenv
-        self.snmp = owenv.snmp_object
+        self.snmp = owenv.snmp_object if poller is None else poller.snmp
         self.oid = oid
+        self.poller = poller
         
         self.rapid_checks = 0
         self.fast_period = 0.5
         
+        # Keywords fed by a poller Host do not poll on their own.
+        if poller is not None:
+            period = None
 
         DFW.Keyword.Double.__init__(self, name, service, period=period)
 
+        # Only a fully built keyword joins the poller's GET; an OID with
+        # no keyword behind it would fail the whole SNMPv1 PDU.
+        if poller is not None:
+            poller.register(self)
+
     def speedUp(self, checks=5):
 
+        if self.poller is not None:
+            self.poller.trigger()
+            return
+
         self.rapid_checks = checks
         self.period(self.fast_period)
 
@@ -232,6 +485,12 @@ class Double(DFW.Keyword.Double):
 
     def read(self):
 
+        if self.poller is not None:
+            result = self.poller.cached(self.oid)
+            if result == '':
+                result = None
+            return result
+
         result, _error_indication, _error_status = self.snmp.getSNMP(self.oid)
 
         if result == '':
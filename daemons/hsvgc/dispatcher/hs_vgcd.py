@@ -3,7 +3,7 @@
 # kpython safely sets RELDIR, KROOT, LROOT, and PYTHONPATH before invoking
 # the actual Python interpreter.
 
-# KPF specific lakeshore controller
+# KTL dispatcher for an Inficon VGC50x vacuum gauge controller
 
 #
 # #
@@ -12,21 +12,22 @@
 #
 
 import argparse
+import asyncio
 import atexit
+import collections
 import configparser
-import logging
 import os
 import pathlib
 import signal
 import sys
-import select
-import socket
 import time
 import threading
 
-import SerialStream
 import DFW                  # provided by kroot/util/dfw
 
+from hispec.driver.inficon.inficonvgc502 import InficonVGC502
+from hispec.trend import ExponentialTrend, SlidingRegression
+
 #
 # #
 # Main execution, invoked by a check at the tail end of this file.
@@ -43,67 +44,46 @@ def main():
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
     
-    main.serial = SerialStream.factory(main.ip, port=main.port)
-    
-    # main.socket = InficonSocket(address=main.ip, port=main.port, delimiter='\r', bytes=True)
-    
-    # Test InficonSocket
-    # main.socket.connect()
-    # command = "AYT"
-    # main.socket.send(command)
-    # command = "\x05"
-    # main.socket.send(command)
-    # print(main.socket.receive_test())
-    
-    # Test InficonSocketAsyncIO
-    # message = b"PRX"
-    # loop = asyncio.get_event_loop()
-    # main.socket = loop.create_connection(lambda: InficonSocketAsyncIO(message, loop), main.ip, main.port)
-    # loop.run_until_complete(main.socket)
-    # loop.run_forever()
-    # loop.close()
-    
-    
-    # Test
-    main.serial.connect()
-    command = b"AYT\r\x05\r"
-    main.serial.send(command)
-    main.serial.send(command)
-    main.serial.send(command)
-    main.serial.send(command)
-    # rv = ''
-    rv = main.serial.receive()
-    print(rv)
-    
-    # with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    #     s.connect((main.ip, int(main.port)))
-    #     command = b"COM,1\r\x05\r"
-    #     s.send(command)
-    #     rv = s.recv(4096)
-        
-    # print(rv)
-    
     # Start up our KTL backend.
-    # main.Service = DFW.Service(main.config.get("main", "service"),
-    #                            main.config.get("main", "stdiosvc"),
-    #                            setupKeywords)   
+    main.Service = DFW.Service(main.config.get("main", "service"),
+                               main.config.get("main", "stdiosvc"),
+                               setupKeywords)
+    
+    # Everything is now running.
+    main.poller.start()
+    
+    while main.shutdown.is_set() == False:
+        try:
+            main.shutdown.wait(300)
+        except (KeyboardInterrupt, SystemExit):
+            break
     
+    # End of execution.
 
 main.config = configparser.ConfigParser()
 main.config_file = None
 main.ip = None
 main.port = None
-main.version = '0.1.1'
+main.version = '0.2.0'
 main.shutdown = threading.Event()
-main.serial = None
+main.poller = None
 main.Service = None
+main.gauges = 3
+main.poll_time = 5
+main.timeout = 2.0
+main.stream = None
+main.deadband = 0.005
+main.history = 3000
+main.trend_window = 30.0
+main.trend_min_samples = 5
+main.ror_alarm = None
 
 def shutdown(*ignored):
     main.shutdown.set()
     
     try:
-        main.serial.disconnect()
-    except:
+        main.poller.stop()
+    except AttributeError:
         pass
     
     if main.Service != None:
@@ -123,7 +103,28 @@ def shutdown(*ignored):
 
 def setupKeywords(service):
     
-    return
+    dispnum = main.dispnum
+    
+    # Dispatcher Keywords
+    prefix = "DISP{}".format(dispnum)
+    DFW.Keyword.Enumerated(prefix + "STA", service, "initializing")
+    DFW.Keyword.String(prefix + "MSG", service, "")
+    DFW.Keyword.String(prefix + "VER", service, main.version)
+    
+    # Gauge Keywords
+    prefix = main.name.upper()
+    DFW.Keyword.String(prefix + "_UNIT", service, "")
+    for gauge in range(1, main.gauges + 1):
+        DFW.Keyword.Double("{}_PRES{}".format(prefix, gauge), service)
+        DFW.Keyword.Integer("{}_STAT{}".format(prefix, gauge), service)
+        DFW.Keyword.Double("{}_ROR{}".format(prefix, gauge), service, 0)
+        DFW.Keyword.Double("{}_TAU{}".format(prefix, gauge), service, 0)
+        DFW.Keyword.Boolean("{}_LEAK{}".format(prefix, gauge), service, False)
+    
+    transport = VGCTransport(main.ip, main.port, timeout=main.timeout)
+    main.poller = VGCPoller(service, transport, prefix, main.gauges, main.poll_time,
+                            stream=main.stream, deadband=main.deadband, history=main.history)
+    main.poller.setupTrends(main.trend_window, main.trend_min_samples, main.ror_alarm)
 
 #
 # #
@@ -201,6 +202,33 @@ def parseConfigFile():
         print("Cannot retrieve name for dispatcher instance: {}".format(e))
         sys.exit(0)
     
+    # One gauge channel per digit in the model number: VGC501, 502, 503.
+    model = main.config.get("device", "model", fallback="VGC503")
+    try:
+        main.gauges = int(model[-1])
+    except ValueError:
+        main.gauges = 3
+    
+    main.poll_time = main.config.getint("device", "poll_time", fallback=main.poll_time)
+    main.timeout = main.config.getfloat("device", "timeout", fallback=main.timeout)
+    main.deadband = main.config.getfloat("device", "deadband", fallback=main.deadband)
+    main.history = main.config.getint("device", "history", fallback=main.history)
+    main.trend_window = main.config.getfloat("device", "trend_window", fallback=main.trend_window)
+    main.trend_min_samples = main.config.getint("device", "trend_min_samples", fallback=main.trend_min_samples)
+    
+    ror_alarm = main.config.get("device", "ror_alarm", fallback="").strip()
+    if ror_alarm != "":
+        main.ror_alarm = float(ror_alarm)
+    
+    # In stream mode the controller pushes readings on its own (COM,n)
+    # instead of being polled every poll_time seconds.
+    mode = main.config.get("device", "mode", fallback="poll").strip().lower()
+    if mode == "stream":
+        main.stream = main.config.getint("device", "stream_interval", fallback=0)
+    elif mode != "poll":
+        print("Unknown device mode '{}', expected poll or stream".format(mode))
+        sys.exit(0)
+    
 def checkSanity():
     ''' Raise exceptions if something is wrong with the runtime
         configuration, as specified by the configuration file and
@@ -233,337 +261,509 @@ def checkSanity():
         print("{} is too small a value (<) for the device poll_time, change in {}".format(polltime, main.config_file))
         sys.exit(0)
     
+    # COM interval codes: 0 = 100 ms, 1 = 1 s, 2 = 1 min.
+    if main.stream is not None and main.stream not in range(len(VGCPoller.STREAM_PERIODS)):
+        print("{} is not a valid device stream_interval (0, 1 or 2), change in {}".format(main.stream, main.config_file))
+        sys.exit(0)
+    
     return    
     
-def readPar(command):
-    ''' Query the target
+class VGCTransport:
+    ''' Event-driven connection to a VGC50x over TCP, built on the
+        InficonVGC502 driver: the driver owns the asyncio streams and the
+        unit commands, this class adds bounded reads, timeouts and
+        pipelined queries. All methods run on the poller's event loop.
     '''
     
-    # dispsta_val = main.Service["DISP{}STA".format(main.dispnum)].read()
+    ACK = b'\x06\r\n'
+    NAK = b'\x15\r\n'
+    ENQ = b'\x05'
+    ETX = b'\x03'
+    TERMINATOR = b'\r\n'
     
-    # if main.serial is None or main.serial.socket is None:
-    #     disconnect()
-    #     dispsta_val = '4'
+    def __init__(self, address, port, timeout=2.0, limit=4096):
         
-    # if dispsta_val == '1' or dispsta_val == '4' or dispsta_val is None:
-    #     connected = initialConnection()
+        self.address = address
+        self.port = int(port)
+        self.timeout = timeout
         
-    #     if connected is False:
-    #         return
-    try:
-        main.serial.send(command)
-    except SerialStream.CommunicationError as e:
-        disconnect()
-        return
-    except Exception as e:
-        ostr = "{}: {}".format(type(e), e)
-        main.Service.log(logging.ERROR, ostr)
-        return
-    
-    rv = readResponse()
-    
-    return rv
-    
-def readResponse():
-    msg = ""
-    try:
-        msg = main.serial.receive()
-    except SerialStream.IncompleteResponse:
-        pass
-    except SerialStream.NoResponse:
-        pass
-    except UnicodeDecodeError as e:
-        ostr = "{}: {}".format(type(e), e)
-        main.Service.log(logging.ERROR, ostr)
-        
-    return msg.strip()
-    
-def disconnect():
-    # if main.serial:
-    #     try:
-    #         main.serial.disconnect()
-    #     except Exception as e:
-    #         ostr = "{}: {}".format(type(e), e)
-    #         main.Service.log(logging.ERROR, ostr)
-    
-    # main.Service["{}_REV".format(main.name)].set("")
-    # main.Service["{}_SERIAL".format(main.name)].set("")    
-    # main.Service["DISP{}MSG".format(main.dispnum)].set("Disconnected to {} {}".format(main.ip, main.port))
-    # main.Service["DISP{}STA".format(main.dispnum)].set('4')
-    
-    return
-
-def initialConnection():
-    # connected = False
-    # if main.shutdown.isSet():
-    #     return False
+        # Upper bound on buffered input; a line longer than this is a
+        # protocol error, not something to keep accumulating.
+        self.limit = limit
+        
+        self.device = InficonVGC502(address=address, port=self.port, log=False)
+        
+    @property
+    def connected(self):
+        
+        return self.device.writer is not None and not self.device.writer.is_closing()
     
-    return True
+    async def connect(self):
+        
+        connection = asyncio.open_connection(self.address, self.port, limit=self.limit)
+        reader, writer = await asyncio.wait_for(connection, self.timeout)
+        self.device.reader = reader
+        self.device.writer = writer
+        
+    async def disconnect(self):
+        
+        writer = self.device.writer
+        self.device.reader = None
+        self.device.writer = None
+        
+        if writer is None:
+            return
+        
+        writer.close()
+        try:
+            await asyncio.wait_for(writer.wait_closed(), self.timeout)
+        except (asyncio.TimeoutError, OSError):
+            pass
+        
+    async def readLine(self):
+        
+        reader = self.device.reader
+        
+        try:
+            line = await asyncio.wait_for(reader.readuntil(self.TERMINATOR), self.timeout)
+        except asyncio.LimitOverrunError as e:
+            # Throw away the oversized line so the next read starts clean.
+            await reader.read(e.consumed)
+            raise ProtocolError("response exceeded {} bytes".format(self.limit))
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("connection closed by {}".format(self.address))
+        
+        return line
     
-
-class InficonSocket:
+    async def resync(self):
+        ''' Discard whatever is left in the input buffer after a bad
+            exchange, so the next pipeline starts on a line boundary.
+        '''
+        
+        reader = self.device.reader
+        
+        while True:
+            try:
+                chunk = await asyncio.wait_for(reader.read(self.limit), 0.1)
+            except asyncio.TimeoutError:
+                return
+            if len(chunk) == 0:
+                return
     
-    def __init__(self, address, port, delimiter='\r', bytes=False):
+    async def query(self, *mnemonics):
+        ''' Send every mnemonic with its enquiry in a single write, then
+            collect the acknowledgement and reply for each in order. The
+            device handles them back to back, so the round trip is paid
+            once rather than once per mnemonic.
+        '''
         
-        self.address = address
-        self.port = int(port)
-        self.delimiter = delimiter
-        self.socket = None
-        self.timeout = 1
-        self.descriptors = tuple()
-        self.connected = False
-        self.raw_bytes = bytes
-        self.received = None
+        writer = self.device.writer
         
-    def connect(self):
+        request = b''.join(m.encode() + self.TERMINATOR + self.ENQ for m in mnemonics)
+        writer.write(request)
+        await asyncio.wait_for(writer.drain(), self.timeout)
         
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.settimeout(self.timeout)
+        replies = list()
         
         try:
-            self.socket.connect((self.address, self.port))
-        except socket.timetout:
-            print("connection attempt timed out")
-        except socket.error:
-            print("connection attempt failed")
-        except:
-            exception = sys.exc_info()[1]
-            print("connection attempt failed: {}".format(exception))
-            
-        self.descriptors = (self.socket,)
+            for mnemonic in mnemonics:
+                acknowledge = await self.readLine()
+                if acknowledge != self.ACK:
+                    raise ProtocolError("{} not acknowledged: {!r}".format(mnemonic, acknowledge))
+                
+                reply = await self.readLine()
+                replies.append(reply.decode('ascii', 'replace').strip())
+        except ProtocolError:
+            await self.resync()
+            raise
         
-        self.socket.setblocking(0)
+        return replies
+    
+    async def startStream(self, interval):
+        ''' Switch the controller to continuous output, one frame with
+            every gauge every interval (0: 100 ms, 1: 1 s, 2: 1 min).
+        '''
         
-        check = self.descriptors
-        _readers, writers, errors = select.select((), check, check, 1)
+        writer = self.device.writer
         
-        if self.socket in errors:
-            print("new connection indicating an error")
+        writer.write("COM,{}".format(interval).encode() + self.TERMINATOR)
+        acknowledge = await self.readLine()
+        if acknowledge != self.ACK:
+            await self.resync()
+            raise ProtocolError("COM,{} not acknowledged: {!r}".format(interval, acknowledge))
         
-        if self.socket in writers:
-            pass
-        else:
-            print("new connection not ready to receive commands")
+        writer.write(self.ENQ)
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        
+    async def stopStream(self):
+        ''' Any input ends continuous output; ETX also clears the
+            controller's input buffer.
+        '''
+        
+        writer = self.device.writer
+        if writer is None:
+            return
+        
+        writer.write(self.ETX)
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        await self.resync()
+        
+    async def readChunk(self, timeout):
+        ''' Return whatever bytes have arrived, waiting at most timeout
+            seconds; an empty result means nothing arrived in time.
+        '''
+        
+        try:
+            chunk = await asyncio.wait_for(self.device.reader.read(self.limit), timeout)
+        except asyncio.TimeoutError:
+            return b''
+        
+        if len(chunk) == 0:
+            raise ConnectionError("connection closed by {}".format(self.address))
         
-        self.connected = True
+        return chunk
     
-    def disconnect(self):
+    async def readPressures(self, gauges):
+        ''' Return a list of (status, pressure) for gauges 1..gauges,
+            with pressure None when the gauge reports no valid reading.
+        '''
         
-        if self.socket is not None:
+        mnemonics = ["PR{}".format(gauge) for gauge in range(1, gauges + 1)]
+        replies = await self.query(*mnemonics)
+        
+        readings = list()
+        
+        for reply in replies:
+            status, _, value = reply.partition(',')
             try:
-                self.socket.shutdown(socket.SHUT_RDWR)
-            except socket.error:
-                pass
-            except:
-                pass
+                status = int(status)
+                pressure = float(value)
+            except ValueError:
+                raise ProtocolError("unexpected pressure reply: {!r}".format(reply))
             
-            try:
-                self.socket.close()
-            except:
-                pass
+            if status != 0:
+                pressure = None
             
-        self.connected = False
-        self.descriptors = tuple()
-        self.socket = None
+            readings.append((status, pressure))
         
-    def reconnect(self):
+        return readings
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class FrameParser:
+    ''' Split the controller's continuous output into frames as bytes
+        arrive, without waiting for or re-scanning complete messages.
+        Each frame is "status,pressure" repeated once per gauge.
+    '''
+    
+    def __init__(self, limit=4096):
         
-        self.disconnect()
-        self.connect()
+        self.buffer = bytearray()
+        self.limit = limit
         
-    def send(self, message):
-            
-        if self.delimiter is not None:
-            message = message + self.delimiter
+    def feed(self, data):
+        ''' Add received bytes; return the list of complete frames, each
+            a list of (status, pressure) like readPressures().
+        '''
+        
+        self.buffer += data
+        frames = list()
+        start = 0
+        
+        while True:
+            end = self.buffer.find(b'\r\n', start)
+            if end < 0:
+                break
             
-        if self.raw_bytes == False:
+            frame = self.parse(bytes(self.buffer[start:end]))
+            if frame is not None:
+                frames.append(frame)
+            start = end + 2
+        
+        del self.buffer[:start]
+        
+        # A partial frame this long is line noise; drop it.
+        if len(self.buffer) > self.limit:
+            self.buffer.clear()
+        
+        return frames
+    
+    @staticmethod
+    def parse(line):
+        
+        fields = line.decode('ascii', 'replace').strip().split(',')
+        if len(fields) < 2 or len(fields) % 2 != 0:
+            return None
+        
+        readings = list()
+        
+        for status, value in zip(fields[0::2], fields[1::2]):
             try:
-                message = str(message)
-                message = message.encode()
-            except AttributeError:
-                pass
-        else:
-            message = bytes(message, 'utf-8')
+                status = int(status)
+                pressure = float(value)
+            except ValueError:
+                return None
             
-        check = self.descriptors
-        _readers, writers, _errors = select.select((), check, (), self.timeout)
-        if self.socket in writers:
-            pass
-        else:
-            print("socket not ready to receive data")
+            if status != 0:
+                pressure = None
             
-        sent = 0
-        while sent < len(message):
-            try:
-                newly_sent = self.socket.send(message[sent:])
-            except socket.error:
-                newly_sent = 0
-                
-            if newly_sent == 0:
-                print("connection lost")
-            else:
-                sent += newly_sent
-                
-        return sent
+            readings.append((status, pressure))
+        
+        return readings
+
+
+class VGCPoller:
+    ''' Run the VGCTransport on one asyncio loop in a background thread,
+        reading every gauge and publishing the keywords. Readings are
+        either polled each period or, with stream set, pushed by the
+        controller in continuous mode. Keywords are only updated when a
+        reading moves by more than the relative deadband, or at least once
+        a period. A lost connection is retried with a capped backoff.
+    '''
+    
+    UNITS = ('mbar', 'Torr', 'Pa', 'Micron', 'hPa', 'V')
+    
+    # Seconds between frames for each COM interval code.
+    STREAM_PERIODS = (0.1, 1.0, 60.0)
     
-    def receive(self, delimiter=None, timeout=None, strip=False, count=None):
+    def __init__(self, service, transport, prefix, gauges, period, stream=None, deadband=0.0, history=3000):
+        
+        self.service = service
+        self.transport = transport
+        self.prefix = prefix
+        self.gauges = gauges
+        self.period = period
+        self.stream = stream
+        self.deadband = deadband
+        
+        # Recent (time, readings) pairs, oldest first.
+        self.history = collections.deque(maxlen=history)
+        self.published = dict()
+        
+        self.rises = dict()
+        self.decays = dict()
+        self.alarms = dict()
+        self.ror_alarm = None
+        self.trends_published = 0
+        
+        self.loop = None
+        self.stopping = None
+        self.thread = None
         
-        begin = time.time()
+    def setupTrends(self, window, min_samples=5, ror_alarm=None):
+        ''' Track the rate of rise and the exponential time constant of
+            each gauge over a sliding window of seconds. A rate of rise
+            above ror_alarm (pressure units per second) raises the gauge's
+            LEAK keyword; None disables the alarm.
+        '''
         
-        if delimiter is None:
-            delimiter = self.delimiter
+        self.ror_alarm = ror_alarm
         
-        if delimiter is not None and count is not None:
-            raise ValueError("cannot specify both a delimiter and a count")
+        for gauge in range(1, self.gauges + 1):
+            self.rises[gauge] = SlidingRegression(window, min_samples)
+            self.decays[gauge] = ExponentialTrend(window, min_samples)
+            self.alarms[gauge] = False
         
-        if count is not None:
-            count = int(count)
+    def start(self):
+        
+        if self.thread is not None:
+            return
+        
+        self.thread = threading.Thread(target=self.run, name='VGC poller')
+        self.thread.daemon = True
+        self.thread.start()
+        
+    def stop(self):
+        
+        if self.loop is not None and self.stopping is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
             
-        if timeout is None:
-            timeout = self.timeout
+        if self.thread is not None:
+            self.thread.join(self.transport.timeout * 2)
             
-        remaining = timeout
-        check = self.descriptors
-        descriptor = check[0]
+    def run(self):
         
-        while True:
-            if self.received is not None:
-                if delimiter is not None and delimiter in self.received:
-                    chunks = self.received.split(delimiter, 1)
-                    message = chunks[0] + delimiter
-                    self.received = chunks[1]
-                    if len(self.received) == 0:
-                        self.received = None
-                    break
-                elif delimiter is None:
-                    if count is not None:
-                        if len(self.received) >= count:
-                            message = self.received[:count]
-                            self.received = self.received[count:]
-                            break
-                    else:
-                        message = self.received
-                        self.received = None
-                        break
-        
-            elapsed = time.time() - begin
-        
-            if elapsed > timeout:
-                if count is not None:
-                    error = "timeout expired before count reached"
-                elif delimiter is None:
-                    error = "timeout expired"
-                else:
-                    error = "timeout expired before delimiter received"
-                
-                if self.received is None or len(self.received) == 0:
-                    print(error)
-                else:
-                    error += ": " + repr(self.received)
-                    print(error)
-            else:
-                remaining = timeout - elapsed
-            
-            readers, writers, errors = select.select(check, (), check, remaining)
-            if descriptor in errors:
-                print("select() indicates an error")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        
+        try:
+            self.loop.run_until_complete(self.poll())
+        finally:
+            self.loop.close()
             
-            if descriptor in readers:
-                received = self.receive_loop()
-                
-                if self.received is None:
-                    self.received = received
-                else:
-                    self.received += received
-                
-        if strip == True:
-            message = message.strip()
+    async def wait(self, delay):
+        ''' Sleep for delay seconds, returning early on shutdown.
+        '''
         
-        return message
-    
-    def receive_loop(self):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
         
-        received = None
+    async def poll(self):
         
-        while True:
-            try:
-                chunk = self.socket.recv(4096)
-            except socket.error:
-                break
-            else:
-                if self.raw_bytes == False:
-                    try:
-                        chunk = chunk.decode('utf-8')
-                    except AttributeError:
-                        pass
-                    except UnicodeDecodeError:
-                        chunk = chunk.decode('utf-8', 'replace')
+        self.stopping = asyncio.Event()
+        backoff = 1
+        
+        while self.stopping.is_set() == False:
             
-            if len(chunk) == 0 or chunk == '':
-                break
+            if self.transport.connected == False:
+                try:
+                    await self.connect()
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.setStatus("not connected", "Cannot connect to {}:{}: {}".format(self.transport.address, self.transport.port, e))
+                    await self.wait(backoff)
+                    backoff = min(backoff * 2, 30)
+                    continue
             
-            if received is None:
-                received = chunk
+            begin = time.monotonic()
+            
+            try:
+                if self.stream is None:
+                    readings = await self.transport.readPressures(self.gauges)
+                else:
+                    await self.streamReadings()
+                    continue
+            except ProtocolError as e:
+                self.service["DISP{}MSG".format(main.dispnum)].set(str(e))
+            except Exception as e:
+                await self.transport.disconnect()
+                self.setStatus("not connected", "Lost connection: {}: {}".format(type(e).__name__, e))
+                await self.wait(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
             else:
-                received += chunk
+                self.record(readings)
+                backoff = 1
             
-        return received
-    
-    def receive_test(self):
+            elapsed = time.monotonic() - begin
+            await self.wait(max(self.period - elapsed, 0))
         
-        # received = None
+        await self.transport.disconnect()
         
-        # while True:
-        #     # try:
-        #     #     chunk = self.socket.recv(4096)
-        #     # except socket.error:
-        #     #     break
-            
-        #     chunk = self.socket.recv(4096)
-            
-        #     if len(chunk) == 0 or chunk == '':
-        #         break
-            
-        #     if received is None:
-        #             received = chunk
-        #     else:
-        #         received += chunk
+    async def connect(self):
         
-        message = None
+        self.setStatus("connecting", "Connecting to {}:{}".format(self.transport.address, self.transport.port))
+        await self.transport.connect()
         
-        while True:
+        try:
+            unit = await asyncio.wait_for(self.transport.device.get_pressure_unit(), self.transport.timeout)
+        except Exception as e:
+            await self.transport.resync()
+            unit = ''
+            self.service["DISP{}MSG".format(main.dispnum)].set("Cannot read pressure unit: {}".format(e))
+        else:
             try:
-                message = self.socket.recv(4096)
-            except OSError:
-                break
+                unit = self.UNITS[unit]
+            except (IndexError, TypeError):
+                unit = str(unit)
+        self.service[self.prefix + "_UNIT"].set(unit)
+        
+        self.setStatus("ready", "Connected to {}:{}".format(self.transport.address, self.transport.port))
+        
+    async def streamReadings(self):
+        ''' Put the controller in continuous mode and consume its frames
+            until shutdown. Raises TimeoutError if the controller goes
+            quiet for several frame periods.
+        '''
+        
+        await self.transport.startStream(self.stream)
+        
+        parser = FrameParser(self.transport.limit)
+        silence = self.STREAM_PERIODS[self.stream] * 3 + self.transport.timeout
+        last = time.monotonic()
+        
+        while self.stopping.is_set() == False:
+            # Short reads so shutdown is noticed promptly.
+            chunk = await self.transport.readChunk(min(silence, 0.5))
+            now = time.monotonic()
             
-            if len(message) == 0:
-                break
+            if len(chunk) == 0:
+                if now - last > silence:
+                    raise asyncio.TimeoutError("no data in continuous mode for {:.1f} s".format(now - last))
+                continue
+            
+            last = now
+            for readings in parser.feed(chunk):
+                self.record(readings[:self.gauges], now)
         
-        return message
+        await self.transport.stopStream()
         
-import asyncio
-class InficonSocketAsyncIO(asyncio.Protocol):
-    def __init__(self, message, loop):
-        self.message = message + b'\r'
-        self.loop = loop
+    def record(self, readings, now=None):
         
-    def connection_made(self, transport):
-        self.transport = transport
-        self.transport.write(self.message)
+        if now is None:
+            now = time.monotonic()
         
-        # enquiry = b'\x05\r'
-        # self.transport.write(enquiry)
+        self.history.append((now, readings))
+        self.publish(readings, now)
+        self.updateTrends(readings, now)
         
-    def data_received(self, data: bytes) -> None:
-        # print(data.decode('utf-8'))
-        print(data)
-        self.transport.close()
+    def updateTrends(self, readings, now):
         
-    def connection_lost(self, exc: Exception | None) -> None:
-        self.loop.stop()
-    
-    
+        if len(self.rises) == 0:
+            return
+        
+        for gauge, (_status, pressure) in enumerate(readings, 1):
+            if pressure is None:
+                # Don't fit across a gap in valid readings.
+                self.rises[gauge].clear()
+                self.decays[gauge].clear()
+            else:
+                self.rises[gauge].add(now, pressure)
+                self.decays[gauge].add(now, pressure)
+        
+        # The fits are updated with every reading; the keywords about once
+        # a second, however fast the readings arrive.
+        if now - self.trends_published < 1.0:
+            return
+        self.trends_published = now
+        
+        for gauge in range(1, len(readings) + 1):
+            rate = self.rises[gauge].slope()
+            tau = self.decays[gauge].tau()
+            
+            self.service["{}_ROR{}".format(self.prefix, gauge)].set(str(rate if rate is not None else 0))
+            self.service["{}_TAU{}".format(self.prefix, gauge)].set(str(tau if tau is not None else 0))
+            
+            alarm = self.ror_alarm is not None and rate is not None and rate > self.ror_alarm
+            if alarm != self.alarms[gauge]:
+                self.alarms[gauge] = alarm
+                self.service["{}_LEAK{}".format(self.prefix, gauge)].set('1' if alarm else '0')
+                if alarm:
+                    message = "Gauge {} rate of rise {:.3g}/s exceeds {:.3g}/s".format(gauge, rate, self.ror_alarm)
+                    self.service["DISP{}MSG".format(main.dispnum)].set(message)
+        
+    def publish(self, readings, now):
+        
+        for gauge, (status, pressure) in enumerate(readings, 1):
+            previous = self.published.get(gauge)
+            if previous is not None:
+                last_status, last_pressure, last_time = previous
+                if status == last_status and now - last_time < self.period \
+                   and self.withinDeadband(pressure, last_pressure):
+                    continue
+            
+            self.published[gauge] = (status, pressure, now)
+            
+            self.service["{}_STAT{}".format(self.prefix, gauge)].set(str(status))
+            if pressure is not None:
+                self.service["{}_PRES{}".format(self.prefix, gauge)].set(str(pressure))
+                
+    def withinDeadband(self, pressure, last_pressure):
+        
+        if pressure is None or last_pressure is None:
+            return pressure is None and last_pressure is None
+        
+        return abs(pressure - last_pressure) <= self.deadband * abs(last_pressure)
+                
+    def setStatus(self, status, message):
+        
+        dispnum = main.dispnum
+        self.service["DISP{}STA".format(dispnum)].set(status)
+        self.service["DISP{}MSG".format(dispnum)].set(message)
 
     
 if __name__ == "__main__":
@@ -1,115 +1,343 @@
 #!/usr/bin/env python
-"""Analyze camerad log files"""
+"""
+Analyze camerad log files.
+
+The log is read once, line by line, so memory use does not grow with the
+size of the file: only the timestamps of the sequence being read are held.
+Lines are classified with one precompiled pattern, and the timestamps of a
+finished sequence are converted to ``np.datetime64`` in a single call.
+
+As a script:
+    loganal.py camerad.log      # prints per-sequence rates, writes camerad.dat
+    loganal.py -c camerad.log   # also writes per-frame columns to camerad.cols/
+
+The column store (see hispec.columnar) has a ``sequences`` table with one
+SUMMARY_DTYPE row per sequence, and ``expose``, ``wait``, ``fetch`` (start,
+stop, hz) and ``archon`` (timestamp) tables with one row per frame, whose
+``seq`` column is the row of the sequence in ``sequences``.
+
+As a module:
+    from loganal import iter_sequences
+    with open("camerad.log", "rb") as log:
+        for seq in iter_sequences(log):
+            print(seq.seqno, seq.shape, seq.expose_hz().mean())
+"""
+import argparse
+import os
+import re
 import sys
-import datetime
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional, Tuple
+
 import numpy as np
 
-ofile = sys.argv[1].split('.')[0] + '.dat'
-ofn = open(ofile, 'w')
-
-tfmt = "%Y-%m-%dT%H:%M:%S.%f"
-nexp = 0
-nseq = -1
-seqno = 1
-in_exposure = False
-in_read = False
-in_wait = False
-print("")
-with open(sys.argv[1]) as fn:
-    lines = fn.readlines()
-    for ln in lines:
-        ts_str = ln.split()[0]
-
-        if " hroi " in ln:
-            # print(ln)
-            vstart = int(ln.split()[-4])
-            vstop = int(ln.split()[-3])
-            hstart = int(ln.split()[-2])
-            hstop = int(ln.split()[-1])
-
-        if "FASTLOADPARAM Expose " in ln:
-            # print(ln)
+if TYPE_CHECKING:
+    from hispec.columnar import ColumnWriter
+
+# Every message the analysis reacts to. camerad writes one message per line,
+# so the first match classifies the line.
+MESSAGES = (
+    b" hroi ",
+    b"FASTLOADPARAM Expose ",
+    b"waiting for new frame:",
+    b"received currentframe:",
+    b"will read image data",
+    b"successfully read",
+    b"READOUT SEQUENCE COMPLETE",
+    b"READOUT COMPLETE",
+    b"Last frame read",
+    b"timestamp in hex",
+)
+(HROI, FASTLOAD, WAITING, RECEIVED, READ_START, READ_STOP,
+ SEQUENCE_COMPLETE, READOUT_COMPLETE, LAST_FRAME, ARCHON_TIME) = range(1, len(MESSAGES) + 1)
+EVENT_OF = {msg: event for event, msg in enumerate(MESSAGES, 1)}
+# Plain alternation: capture groups would disable the regex engine's
+# first-character scan and make the search an order of magnitude slower
+EVENTS = re.compile(b"|".join(re.escape(msg) for msg in MESSAGES))
+
+RATES = ("expose", "fetch", "wait")
+ROI_FIELDS = ("vstart", "vstop", "hstart", "hstop")
+
+# Per-sequence summary: where the sequence is, what was taken, and the
+# count, mean and spread of each rate
+SUMMARY_DTYPE = np.dtype(
+    [("file", np.int32), ("seqno", np.int32), ("offset", np.int64), ("end", np.int64)]
+    + [(name, np.int32) for name in ROI_FIELDS]
+    + [("nseq", np.int32), ("nexp", np.int32)]
+    + [(f"{rate}_{stat}", np.float64) for rate in RATES for stat in ("n", "mean", "std")])
+
+DAT_FORMAT = ("%3d %4d %4d %4d %4d %3d %3d %3d %3d "
+              "%8.3f %8.3f %8.3f %8.3f %8.3f %8.3f\n")
+
+
+def to_datetime64(stamps: List[bytes]) -> np.ndarray:
+    """Convert ISO-8601 log timestamps to a ``datetime64[us]`` array."""
+    return np.array(stamps, dtype="datetime64[us]")
+
+
+def seconds(start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """Elapsed seconds from ``start`` to ``stop``, for any length of interval."""
+    return (stop - start) / np.timedelta64(1, "s")
+
+
+def rate(start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """Rate (Hz) of the intervals from ``start`` to ``stop``."""
+    return 1.0 / seconds(start, stop)
+
+
+@dataclass
+class Sequence:
+    """Timestamps of one exposure sequence (``FASTLOADPARAM Expose`` to
+    ``READOUT SEQUENCE COMPLETE``). Timestamp arrays are ``datetime64[us]``
+    and pair element by element with their start or stop counterpart."""
+    seqno: int
+    roi: Tuple[int, int, int, int]
+    nseq: int
+    expose_start: np.ndarray
+    expose_stop: np.ndarray
+    wait_start: np.ndarray
+    wait_stop: np.ndarray
+    read_start: np.ndarray
+    read_stop: np.ndarray
+    archon: np.ndarray
+    synced: List[bool] = field(default_factory=list)
+    offset: int = 0     # byte offset in the log where the sequence starts
+    end: int = 0        # byte offset just past its READOUT SEQUENCE COMPLETE line
+
+    @property
+    def nexp(self) -> int:
+        """Number of exposures read out."""
+        return len(self.expose_stop)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(rows, columns) of the region of interest."""
+        vstart, vstop, hstart, hstop = self.roi
+        return vstop - vstart + 1, hstop - hstart + 1
+
+    def expose_hz(self) -> np.ndarray:
+        """Exposure rate of each frame after the first."""
+        return rate(self.expose_start[1:], self.expose_stop[1:])
+
+    def fetch_hz(self) -> np.ndarray:
+        """Rate of each read of image data from the controller."""
+        return rate(self.read_start, self.read_stop)
+
+    def wait_hz(self) -> np.ndarray:
+        """Rate of each wait for a new frame."""
+        return rate(self.wait_start, self.wait_stop)
+
+
+class _Pending:
+    """Timestamps collected for the sequence being read, still as bytes."""
+
+    def __init__(self):
+        self.expose_start: List[bytes] = []
+        self.expose_stop: List[bytes] = []
+        self.wait_start: List[bytes] = []
+        self.wait_stop: List[bytes] = []
+        self.read_start: List[bytes] = []
+        self.read_stop: List[bytes] = []
+        self.archon: List[int] = []
+        self.synced: List[bool] = []
+
+    def finish(self, seqno, roi, nseq, offset, end) -> Sequence:
+        return Sequence(
+            seqno, roi, nseq,
+            to_datetime64(self.expose_start), to_datetime64(self.expose_stop),
+            to_datetime64(self.wait_start), to_datetime64(self.wait_stop),
+            to_datetime64(self.read_start), to_datetime64(self.read_stop),
+            np.array(self.archon, dtype=np.int64), self.synced, offset, end)
+
+
+def parse_roi(line: bytes) -> Tuple[int, int, int, int]:
+    """ROI (vstart, vstop, hstart, hstop) from an ``hroi`` line."""
+    return tuple(int(v) for v in line.split()[-4:])
+
+
+def roi_before(log, offset: int) -> Tuple[int, int, int, int]:
+    """Last ROI set before byte ``offset`` of ``log`` (bytes or an mmap)."""
+    at = log.rfind(b" hroi ", 0, offset)
+    if at < 0:
+        return (0, 0, 0, 0)
+    eol = log.find(b"\n", at)
+    return parse_roi(log[at:eol if eol >= 0 else len(log)])
+
+
+def iter_sequences(stream: BinaryIO, first: int = 1, offset: int = 0,
+                   stop: Optional[int] = None,
+                   roi: Tuple[int, int, int, int] = (0, 0, 0, 0)) -> Iterator[Sequence]:
+    """
+    Parse a camerad log and yield each exposure sequence as it completes.
+
+    Args:
+        stream: Log opened in binary mode
+        first: Number given to the first sequence
+        offset: Byte offset of the stream's position in the log
+        stop: Byte offset of a line at which to stop reading
+        roi: ROI in force at ``offset``, if it was set earlier in the log
+    """
+    nseq = -1
+    seqno = first
+    frame: Optional[int] = None
+    exp_start = rd_start = b""
+    in_exposure = in_read = in_wait = False
+    pending = _Pending()
+    start = offset
+    search = EVENTS.search
+
+    for ln in stream:
+        here = offset
+        offset += len(ln)
+        m = search(ln)
+        if m is None:
+            continue
+        if stop is not None and here >= stop:
+            return
+        event = EVENT_OF[m.group()]
+        ts = ln[:ln.find(b" ")]
+
+        if event == HROI:
+            roi = parse_roi(ln)
+
+        elif event == FASTLOAD:
             nseq = int(ln.split()[-1])
-            nexp = 0
-            deltas = []
-            rdeltas = []
-            wdeltas = []
-
-        if "waiting for new frame:" in ln:
-            # print(ln)
-            ts_exp_start = datetime.datetime.strptime(ts_str, tfmt)
-            in_exposure = True
-            in_wait = True
-
-        if "received currentframe:" in ln:
-            ts_wait_stop = datetime.datetime.strptime(ts_str, tfmt)
+            pending = _Pending()
+            start = here
+
+        elif event == WAITING:
+            exp_start = ts
+            in_exposure = in_wait = True
+
+        elif event == RECEIVED:
             if in_wait:
-                wdeltas.append(ts_wait_stop - ts_exp_start)
+                pending.wait_start.append(exp_start)
+                pending.wait_stop.append(ts)
                 in_wait = False
 
-        if "will read image data" in ln:
-            ts_rd_start = datetime.datetime.strptime(ts_str, tfmt)
+        elif event == READ_START:
+            rd_start = ts
             frame = int(ln.split()[-1])
             in_read = True
 
-        if "successfully read" in ln:
+        elif event == READ_STOP:
             if in_read:
-                ts_rd_stop = datetime.datetime.strptime(ts_str, tfmt)
-                rdeltas.append(ts_rd_stop - ts_rd_start)
+                pending.read_start.append(rd_start)
+                pending.read_stop.append(ts)
                 in_read = False
 
-        if "READOUT COMPLETE" in ln:
-            # print(ln)
+        elif event == READOUT_COMPLETE:
             if in_exposure:
-                ts_exp_stop = datetime.datetime.strptime(ts_str, tfmt)
-                deltas.append(ts_exp_stop - ts_exp_start)
-                nexp += 1
+                pending.expose_start.append(exp_start)
+                pending.expose_stop.append(ts)
                 in_exposure = False
 
-        if "Last frame read" in ln:
-            last_frame = int(ln.split()[-4])
-            if frame == last_frame:
-                print("Sequence synced")
-            else:
-                print("Sequence NOT synced")
-
-        if "READOUT SEQUENCE COMPLETE" in ln:
-            if nexp > 1:
-                print("\nSequence %d" % seqno)
-                print(vstart, vstop, hstart, hstop)
-                print(vstop-vstart+1, "x", hstop-hstart+1)
-                print(nexp, "out of ", nseq)
-                gdelts = deltas[1:]
-                d_hz = []
-                for d in gdelts:
-                    d_hz.append(1.e6/d.microseconds)
-                d_hz = np.asarray(d_hz)
-                r_hz = []
-                for r in rdeltas:
-                    r_hz.append(1.e6/r.microseconds)
-                r_hz = np.asarray(r_hz)
-                w_hz = []
-                for w in wdeltas:
-                    w_hz.append(1.e6/w.microseconds)
-                w_hz = np.asarray(w_hz)
-
-                print("Expos Hz = %.3f +- %.3f" % (d_hz.mean(), d_hz.std()))
-                print("Fetch Hz = %.3f +- %.3f" % (r_hz.mean(), r_hz.std()))
-                print("Wait  Hz = %.3f +- %.3f" % (w_hz.mean(), w_hz.std()))
-                ofn.write(
-                    "%3d %4d %4d %4d %4d %3d %3d %3d %3d "
-                    "%8.3f %8.3f %8.3f %8.3f %8.3f %8.3f\n"
-                    % (seqno, vstart, vstop, hstart, hstop,
-                       vstop-vstart+1, hstop-hstart+1, nexp, nseq,
-                       d_hz.mean(), d_hz.std(), r_hz.mean(), r_hz.std(),
-                       w_hz.mean(), w_hz.std()))
-                seqno += 1
-            else:
-                print("Sequence %d" % seqno)
-                print(vstart, vstop, hstart, hstop)
-                print(vstop - vstart + 1, "x", hstop - hstart + 1)
-                print(nexp, "out of ", nseq)
-                print("")
-                seqno += 1
-
-ofn.close()
\ No newline at end of file
+        elif event == LAST_FRAME:
+            pending.synced.append(frame == int(ln.split()[-4]))
+
+        elif event == ARCHON_TIME:
+            pending.archon.append(int(ln[ln.find(b"decimal: ") + 9:]))
+
+        elif event == SEQUENCE_COMPLETE:
+            yield pending.finish(seqno, roi, nseq, start, offset)
+            seqno += 1
+            pending = _Pending()
+            start = offset
+
+
+def report(seq: Sequence, out=sys.stdout) -> Optional[str]:
+    """Print the summary of ``seq`` and return its line for the .dat file,
+    or None when it has too few exposures for rates."""
+    for synced in seq.synced:
+        print("Sequence synced" if synced else "Sequence NOT synced", file=out)
+    rows, cols = seq.shape
+    if seq.nexp <= 1:
+        print("Sequence %d" % seq.seqno, file=out)
+        print(*seq.roi, file=out)
+        print(rows, "x", cols, file=out)
+        print(seq.nexp, "out of ", seq.nseq, file=out)
+        print("", file=out)
+        return None
+    d_hz, r_hz, w_hz = seq.expose_hz(), seq.fetch_hz(), seq.wait_hz()
+    print("\nSequence %d" % seq.seqno, file=out)
+    print(*seq.roi, file=out)
+    print(rows, "x", cols, file=out)
+    print(seq.nexp, "out of ", seq.nseq, file=out)
+    print("Expos Hz = %.3f +- %.3f" % (d_hz.mean(), d_hz.std()), file=out)
+    print("Fetch Hz = %.3f +- %.3f" % (r_hz.mean(), r_hz.std()), file=out)
+    print("Wait  Hz = %.3f +- %.3f" % (w_hz.mean(), w_hz.std()), file=out)
+    return DAT_FORMAT % (seq.seqno, *seq.roi, rows, cols, seq.nexp, seq.nseq,
+                         d_hz.mean(), d_hz.std(), r_hz.mean(), r_hz.std(),
+                         w_hz.mean(), w_hz.std())
+
+
+def summarize(seq: Sequence, fileno: int = 0) -> tuple:
+    """SUMMARY_DTYPE record of ``seq``, found in file number ``fileno``."""
+    stats = []
+    for hz in (seq.expose_hz(), seq.fetch_hz(), seq.wait_hz()):
+        if len(hz):
+            stats += [len(hz), hz.mean(), hz.std()]
+        else:
+            stats += [0, 0.0, 0.0]
+    return (fileno, seq.seqno, seq.offset, seq.end, *seq.roi,
+            seq.nseq, seq.nexp, *stats)
+
+
+def write_columns(out: "ColumnWriter", row: int, seq: Sequence, fileno: int = 0) -> None:
+    """Append ``seq`` to a column store as row ``row`` of its sequences table."""
+    out.append_records("sequences", np.array([summarize(seq, fileno)], dtype=SUMMARY_DTYPE))
+    for table, start, stop in (("expose", seq.expose_start, seq.expose_stop),
+                               ("wait", seq.wait_start, seq.wait_stop),
+                               ("fetch", seq.read_start, seq.read_stop)):
+        out.append(table, seq=np.full(len(start), row, dtype=np.int32),
+                   start=start, stop=stop, hz=rate(start, stop))
+    out.append("archon", seq=np.full(len(seq.archon), row, dtype=np.int32),
+               timestamp=seq.archon)
+
+
+def analyze(path: str, dat_path: Optional[str] = None,
+            columns: Optional[str] = None) -> str:
+    """
+    Summarize every sequence in the log at ``path``; returns the .dat path.
+
+    With ``columns``, per-frame timestamps and the sequence summaries are
+    also written to that column store.
+    """
+    if dat_path is None:
+        dat_path = os.path.splitext(path)[0] + ".dat"
+    print("")
+    out = None
+    if columns:
+        # Only the column store needs hispec; the .dat report needs just numpy
+        from hispec.columnar import ColumnWriter  # pylint: disable=C0415
+        out = ColumnWriter(columns)
+    try:
+        with open(path, "rb") as log, open(dat_path, "w") as dat:
+            for row, seq in enumerate(iter_sequences(log)):
+                line = report(seq)
+                if line is not None:
+                    dat.write(line)
+                if out is not None:
+                    write_columns(out, row, seq)
+    finally:
+        if out is not None:
+            out.close()
+    return dat_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze camerad log files")
+    parser.add_argument("log", help="camerad log file")
+    parser.add_argument("-c", "--columns", action="store_true",
+                        help="also write per-frame columns to a store (default <log>.cols)")
+    parser.add_argument("--store", help="column store directory for -c")
+    args = parser.parse_args(argv)
+    columns = None
+    if args.columns or args.store:
+        columns = args.store or os.path.splitext(args.log)[0] + ".cols"
+    analyze(args.log, columns=columns)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
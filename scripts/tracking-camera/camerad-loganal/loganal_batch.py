@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Analyze many camerad logs at once and index their exposure sequences.
+
+Each log is cut into shards at ``FASTLOADPARAM Expose`` lines (found with
+mmap, so planning does not read the file into memory) and the shards are
+parsed in a process pool with loganal.iter_sequences. Workers return one
+compact record per sequence: where it is (file, byte range), its ROI and
+FASTLOADPARAM count, and the count, mean and spread of its rates. The
+records are saved as an index, from which any sequence can be re-read
+directly, and merged into corpus-wide statistics per ROI.
+
+Usage:
+    loganal_batch.py index -j 8 -o run.npz logs/*.log
+    loganal_batch.py stats run.npz
+    loganal_batch.py show run.npz 12
+"""
+import argparse
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence as Seq, Tuple
+
+import numpy as np
+
+from loganal import (RATES, ROI_FIELDS, SUMMARY_DTYPE, Sequence, iter_sequences,
+                     report, roi_before, summarize)
+
+SHARD_SIZE = 64 << 20   # bytes of log per worker task
+
+Shard = Tuple[int, str, int, int, Tuple[int, int, int, int]]
+
+
+def plan_shards(fileno: int, path: str, shard_size: int = SHARD_SIZE) -> List[Shard]:
+    """
+    Split the log at ``path`` into (fileno, path, start, stop, roi) shards.
+
+    Every shard after the first starts at a ``FASTLOADPARAM Expose`` line,
+    so no sequence straddles two shards; ``roi`` is the last ROI set before
+    the shard starts.
+    """
+    with open(path, "rb") as log:
+        size = os.fstat(log.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = [0]
+            target = shard_size
+            while target < size:
+                hit = mm.find(b"FASTLOADPARAM Expose ", target)
+                if hit < 0:
+                    break
+                start = mm.rfind(b"\n", 0, hit) + 1
+                if start > bounds[-1]:
+                    bounds.append(start)
+                target = hit + shard_size
+            bounds.append(size)
+
+            shards = []
+            for start, stop in zip(bounds, bounds[1:]):
+                shards.append((fileno, path, start, stop, roi_before(mm, start)))
+    return shards
+
+
+def summarize_shard(shard: Shard) -> List[tuple]:
+    """Index records of the sequences in one shard (runs in a worker)."""
+    fileno, path, start, stop, roi = shard
+    with open(path, "rb") as log:
+        log.seek(start)
+        return [summarize(seq, fileno)
+                for seq in iter_sequences(log, offset=start, stop=stop, roi=roi)]
+
+
+def build_index(paths: Seq[str], workers: Optional[int] = None,
+                shard_size: int = SHARD_SIZE) -> np.ndarray:
+    """Parse every log in ``paths`` in parallel and return the sequence index."""
+    shards = [shard for fileno, path in enumerate(paths)
+              for shard in plan_shards(fileno, path, shard_size)]
+    records = []
+    counts: Dict[int, int] = {}
+    with ProcessPoolExecutor(workers) as pool:
+        for shard_records in pool.map(summarize_shard, shards):
+            # Shards number their sequences from 1; number them within each file
+            for fileno, _seqno, *rest in shard_records:
+                counts[fileno] = counts.get(fileno, 0) + 1
+                records.append((fileno, counts[fileno], *rest))
+    return np.array(records, dtype=SUMMARY_DTYPE)
+
+
+def save_index(path: str, files: Seq[str], index: np.ndarray) -> None:
+    """Write the index and the list of files it refers to."""
+    np.savez(path, files=np.array(files, dtype=str), sequences=index)
+
+
+def load_index(path: str) -> Tuple[List[str], np.ndarray]:
+    """Return (files, index) written by save_index."""
+    with np.load(path) as saved:
+        return saved["files"].tolist(), saved["sequences"]
+
+
+def read_sequence(files: Seq[str], index: np.ndarray, i: int) -> Sequence:
+    """Re-read sequence ``i`` of the index from its byte range of the log."""
+    rec = index[i]
+    roi = tuple(int(rec[name]) for name in ROI_FIELDS)
+    with open(files[rec["file"]], "rb") as log:
+        log.seek(int(rec["offset"]))
+        return next(iter_sequences(log, first=int(rec["seqno"]), offset=int(rec["offset"]),
+                                   stop=int(rec["end"]), roi=roi))
+
+
+def merge_stats(index: np.ndarray) -> Dict[Tuple[int, int], Dict[str, Tuple[int, float, float]]]:
+    """
+    Combine the per-sequence rate statistics of ``index`` for each ROI shape.
+
+    Returns {(rows, cols): {rate: (n, mean, std)}}, the same as computing
+    each rate over every frame of every sequence of that shape.
+    """
+    shapes = np.stack([index["vstop"] - index["vstart"] + 1,
+                       index["hstop"] - index["hstart"] + 1], axis=1)
+    if not len(shapes):
+        return {}
+    keys, group = np.unique(shapes, axis=0, return_inverse=True)
+    group = group.ravel()
+    merged = {tuple(int(v) for v in key): {} for key in keys}
+    for rate in RATES:
+        n = index[f"{rate}_n"]
+        mean = index[f"{rate}_mean"]
+        std = index[f"{rate}_std"]
+        total = np.bincount(group, weights=n, minlength=len(keys))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grand = np.bincount(group, weights=n * mean, minlength=len(keys)) / total
+            spread = np.bincount(group, weights=n * (std**2 + (mean - grand[group])**2),
+                                 minlength=len(keys)) / total
+        for key, count, avg, var in zip(keys, total, grand, spread):
+            merged[tuple(int(v) for v in key)][rate] = (
+                int(count), float(avg) if count else 0.0, float(np.sqrt(var)) if count else 0.0)
+    return merged
+
+
+def print_stats(files: Seq[str], index: np.ndarray, out=sys.stdout) -> None:
+    print("%d sequences in %d files" % (len(index), len(files)), file=out)
+    print("%9s %6s %8s  %-19s %-19s %-19s" % ("ROI", "seqs", "frames", "Expos Hz", "Fetch Hz", "Wait  Hz"),
+          file=out)
+    shapes = np.stack([index["vstop"] - index["vstart"] + 1,
+                       index["hstop"] - index["hstart"] + 1], axis=1)
+    for (rows, cols), rates in sorted(merge_stats(index).items()):
+        nseqs = int(np.count_nonzero((shapes[:, 0] == rows) & (shapes[:, 1] == cols)))
+        cells = ["%8.3f +- %8.3f" % (mean, std) for _n, mean, std in (rates[r] for r in RATES)]
+        print("%4d x %-4d%6d %8d  %s" % (rows, cols, nseqs, rates["expose"][0], " ".join(cells)),
+              file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_cmd = commands.add_parser("index", help="parse logs and write a sequence index")
+    index_cmd.add_argument("logs", nargs="+", help="camerad log files")
+    index_cmd.add_argument("-o", "--output", default="loganal_index.npz", help="index file to write")
+    index_cmd.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all CPUs)")
+    index_cmd.add_argument("--shard-mb", type=int, default=SHARD_SIZE >> 20, help="MB of log per worker task")
+
+    stats_cmd = commands.add_parser("stats", help="print merged statistics from an index")
+    stats_cmd.add_argument("index", help="index file")
+
+    show_cmd = commands.add_parser("show", help="re-read and report one indexed sequence")
+    show_cmd.add_argument("index", help="index file")
+    show_cmd.add_argument("number", type=int, help="position of the sequence in the index")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        index = build_index(args.logs, args.jobs, args.shard_mb << 20)
+        save_index(args.output, args.logs, index)
+        print_stats(args.logs, index)
+        print("Index written to %s" % args.output)
+        return 0
+
+    files, index = load_index(args.index)
+    if args.command == "stats":
+        print_stats(files, index)
+        return 0
+
+    if not 0 <= args.number < len(index):
+        print("no sequence %d; the index holds %d" % (args.number, len(index)), file=sys.stderr)
+        return 1
+    print(files[index[args.number]["file"]])
+    report(read_sequence(files, index, args.number))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
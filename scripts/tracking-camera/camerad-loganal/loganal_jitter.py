@@ -1,169 +1,236 @@
 #!/usr/bin/env python
-"""Analyze camerad log files"""
+"""
+Analyze camerad log files, including loop-time and Archon timestamp jitter.
+
+    loganal_jitter.py camerad.log       # per-sequence report, plots of the last sequence
+    loganal_jitter.py -f camerad.log    # follow a growing log
+
+In follow mode the log is tailed: only bytes appended since the last read
+are parsed, and after every READOUT SEQUENCE COMPLETE the sequence report
+is printed together with running statistics over every sequence seen so
+far. The running statistics are constant-memory estimators
+(hispec.running), so the log can be followed indefinitely.
+"""
+import argparse
+import mmap
+import os
 import sys
-import datetime
+import time
+from typing import BinaryIO, Iterator, Optional
+
 import numpy as np
 
-ofile = sys.argv[1].split('.')[0] + '.dat'
-ofn = open(ofile, 'w')
-
-tfmt = "%Y-%m-%dT%H:%M:%S.%f"
-nexp = 0
-nseq = -1
-seqno = 1
-in_exposure = False
-in_read = False
-in_wait = False
-prev_archon_ts = None
-print("")
-with open(sys.argv[1]) as fn:
-    lines = fn.readlines()
-    for ln in lines:
-        ts_str = ln.split()[0]
-
-        if " hroi " in ln:
-            # print(ln)
-            vstart = int(ln.split()[-4])
-            vstop = int(ln.split()[-3])
-            hstart = int(ln.split()[-2])
-            hstop = int(ln.split()[-1])
-
-        if "FASTLOADPARAM Expose " in ln:
-            # print(ln)
-            nseq = int(ln.split()[-1])
-            nexp = 0
-            deltas = []
-            rdeltas = []
-            wdeltas = []
-            successfully_read_ts = []
-            archon_ts = []
-
-        if "waiting for new frame:" in ln:
-            # print(ln)
-            ts_exp_start = datetime.datetime.strptime(ts_str, tfmt)
-            in_exposure = True
-            in_wait = True
-
-        if "received currentframe:" in ln:
-            ts_wait_stop = datetime.datetime.strptime(ts_str, tfmt)
-            if in_wait:
-                wdeltas.append(ts_wait_stop - ts_exp_start)
-                in_wait = False
-
-        if "will read image data" in ln:
-            ts_rd_start = datetime.datetime.strptime(ts_str, tfmt)
-            frame = int(ln.split()[-1])
-            in_read = True
-
-        if "successfully read" in ln:
-            if in_read:
-                ts_rd_stop = datetime.datetime.strptime(ts_str, tfmt)
-                rdeltas.append(ts_rd_stop - ts_rd_start)
-                successfully_read_ts.append(ts_rd_stop.timestamp()*1e6)
-                in_read = False
-
-        if "READOUT COMPLETE" in ln:
-            # print(ln)
-            if in_exposure:
-                ts_exp_stop = datetime.datetime.strptime(ts_str, tfmt)
-                deltas.append(ts_exp_stop - ts_exp_start)
-                nexp += 1
-                in_exposure = False
-
-        if "Last frame read" in ln:
-            last_frame = int(ln.split()[-4])
-            if frame == last_frame:
-                print("Sequence synced")
-            else:
-                print("Sequence NOT synced")
-        
-        if "timestamp in hex" in ln:
-            index = ln.find("decimal: ")
-            current_ts = int(ln[index + 9:])
-            archon_ts.append(current_ts)
-
-        if "READOUT SEQUENCE COMPLETE" in ln:
-            if nexp > 1:
-                print("\nSequence %d" % seqno)
-                print(vstart, vstop, hstart, hstop)
-                print(vstop-vstart+1, "x", hstop-hstart+1)
-                print(nexp, "out of ", nseq)
-                gdelts = deltas[1:]
-                d_hz = []
-                for d in gdelts:
-                    d_hz.append(1.e6/d.microseconds)
-                d_hz = np.asarray(d_hz)
-                r_hz = []
-                for r in rdeltas:
-                    r_hz.append(1.e6/r.microseconds)
-                r_hz = np.asarray(r_hz)
-                w_hz = []
-                for w in wdeltas:
-                    w_hz.append(1.e6/w.microseconds)
-                w_hz = np.asarray(w_hz)
-
-                successfully_read_ts = np.asarray(successfully_read_ts)
-                successfully_read_deltas = np.diff(successfully_read_ts)
-                archon_deltas = np.diff(archon_ts)
-
-                print(f'Median Loop Time = {np.median(successfully_read_deltas):0.2f} us | Mean Loop Time = {successfully_read_deltas.mean():0.2f} us | Jitter = {np.std(successfully_read_deltas):0.2f} us')
-
-
-                print("Expos Hz = %.3f +- %.3f" % (np.median(d_hz), d_hz.std()))
-                print("Fetch Hz = %.3f +- %.3f" % (np.median(r_hz), r_hz.std()))
-                print("Wait  Hz = %.3f +- %.3f" % (np.median(w_hz), w_hz.std()))
-                print(f"Archon ts diff median: {np.median(archon_deltas):0.2f} | Mean time {archon_deltas.mean():0.2f} | Jitter = {np.std(archon_deltas):0.2f}")
-                ofn.write(
-                    "%3d %4d %4d %4d %4d %3d %3d %3d %3d "
-                    "%8.3f %8.3f %8.3f %8.3f %8.3f %8.3f\n"
-                    % (seqno, vstart, vstop, hstart, hstop,
-                       vstop-vstart+1, hstop-hstart+1, nexp, nseq,
-                       d_hz.mean(), d_hz.std(), r_hz.mean(), r_hz.std(),
-                       w_hz.mean(), w_hz.std()))
-                seqno += 1
-            else:
-                print("Sequence %d" % seqno)
-                print(vstart, vstop, hstart, hstop)
-                print(vstop - vstart + 1, "x", hstop - hstart + 1)
-                print(nexp, "out of ", nseq)
-                print("")
-                seqno += 1
-
-ofn.close()
-
-## Timing Jitter Plots
-import matplotlib.pyplot as plt
-plt.ion()
-
-fig, axs = plt.subplots(2,3, figsize=(8.6, 7.7))
-
-# Loop Time vs Iteration Full
-axs[0,0].plot(successfully_read_deltas, 'o', markersize=2)
-axs[0,0].set_title('Full Scale')
-axs[0,0].set_xlabel('Loop Iteration'); axs[0,0].set_ylabel('Runtime [us]')
-
-# Loop Time Histogram Full
-axs[0,1].hist(successfully_read_deltas, bins=20)
-axs[0,1].set_title('Full Scale')
-axs[0,1].set_xlabel('Loop Time [us]'); axs[0,1].set_ylabel('Occurrences')
-
-# Loop Time vs Iteration Full
-axs[1,0].plot(successfully_read_deltas, 'o', markersize=2)
-axs[1,0].set_title('Zoom In')
-axs[1,0].set_xlabel('Loop Iteration'); axs[1,0].set_ylabel('Runtime [us]')
-axs[1,0].set_ylim(900, 1200)
-
-# Loop Time Histogram Full
-axs[1,1].hist(successfully_read_deltas, bins=20)
-axs[1,1].set_title('Zoom In')
-axs[1,1].set_xlabel('Loop Time [us]'); axs[1,1].set_ylabel('Occurrences')
-axs[1,1].set_ylim(0, 100)
-
-# Loop Time vs Iteration Full
-axs[0,2].plot(archon_deltas, 'o', markersize=2)
-axs[0,2].set_title('Full Scale Archon times')
-axs[0,2].set_xlabel('Loop Iteration'); axs[0,0].set_ylabel('Runtime [us]')
-
-
-fig.suptitle(f'Camerad Log File\nStatistics - STD={np.std(successfully_read_deltas):0.2f}us Mean={successfully_read_deltas.mean():0.2f}us')
-plt.tight_layout()
+from hispec import perf
+from hispec.running import RunningSummary
+from loganal import DAT_FORMAT, Sequence, iter_sequences, roi_before
+
+POLL = 0.2      # seconds between checks for new log data in follow mode
+
+
+def loop_times(seq: Sequence) -> np.ndarray:
+    """Time (us) between successive completed image reads."""
+    return np.diff(seq.read_stop) / np.timedelta64(1, "us")
+
+
+def archon_deltas(seq: Sequence) -> np.ndarray:
+    """Differences of successive Archon frame timestamps."""
+    return np.diff(seq.archon)
+
+
+def report(seq: Sequence, out=sys.stdout) -> Optional[str]:
+    """Print the jitter summary of ``seq`` and return its line for the .dat
+    file, or None when it has too few exposures for rates."""
+    for synced in seq.synced:
+        print("Sequence synced" if synced else "Sequence NOT synced", file=out)
+    rows, cols = seq.shape
+    if seq.nexp <= 1:
+        print("Sequence %d" % seq.seqno, file=out)
+        print(*seq.roi, file=out)
+        print(rows, "x", cols, file=out)
+        print(seq.nexp, "out of ", seq.nseq, file=out)
+        print("", file=out)
+        return None
+    d_hz, r_hz, w_hz = seq.expose_hz(), seq.fetch_hz(), seq.wait_hz()
+    loop = perf.describe(loop_times(seq))
+    print("\nSequence %d" % seq.seqno, file=out)
+    print(*seq.roi, file=out)
+    print(rows, "x", cols, file=out)
+    print(seq.nexp, "out of ", seq.nseq, file=out)
+    print(f'Median Loop Time = {loop.median:0.2f} us | Mean Loop Time = {loop.mean:0.2f} us '
+          f'| Jitter = {loop.std:0.2f} us', file=out)
+    for name, hz in (("Expos", d_hz), ("Fetch", r_hz), ("Wait ", w_hz)):
+        stats = perf.describe(hz, percentiles=())
+        print("%s Hz = %.3f +- %.3f" % (name, stats.median, stats.std), file=out)
+    if len(seq.archon) > 1:
+        archon = perf.describe(archon_deltas(seq), percentiles=())
+        print(f"Archon ts diff median: {archon.median:0.2f} | Mean time {archon.mean:0.2f} "
+              f"| Jitter = {archon.std:0.2f}", file=out)
+    return DAT_FORMAT % (seq.seqno, *seq.roi, rows, cols, seq.nexp, seq.nseq,
+                         d_hz.mean(), d_hz.std(), r_hz.mean(), r_hz.std(),
+                         w_hz.mean(), w_hz.std())
+
+
+class RunningJitter:
+    """Running statistics of every sequence seen, in constant memory."""
+
+    QUANTILES = (0.05, 0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self.sequences = 0
+        self.loop = RunningSummary(self.QUANTILES)
+        self.fetch = RunningSummary(self.QUANTILES)
+        self.wait = RunningSummary(self.QUANTILES)
+        self.archon = RunningSummary(self.QUANTILES)
+
+    def update(self, seq: Sequence) -> None:
+        self.sequences += 1
+        self.loop.extend(loop_times(seq))
+        self.fetch.extend(seq.fetch_hz())
+        self.wait.extend(seq.wait_hz())
+        self.archon.extend(archon_deltas(seq))
+
+    def report(self, out=sys.stdout) -> None:
+        print("Running over %d sequences:" % self.sequences, file=out)
+        for name, unit, summary in (("Loop  ", "us", self.loop), ("Fetch ", "Hz", self.fetch),
+                                    ("Wait  ", "Hz", self.wait), ("Archon", "  ", self.archon)):
+            if not summary.count:
+                continue
+            m = summary.moments
+            print("  %s %s n=%-8d mean %10.2f std %9.2f | median %10.2f  p5 %10.2f  "
+                  "p95 %10.2f  p99 %10.2f" % (
+                      name, unit, m.count, m.mean, m.std, summary.median,
+                      summary.quantile(0.05), summary.quantile(0.95), summary.quantile(0.99)),
+                  file=out)
+
+
+def follow(log: BinaryIO, poll: float = POLL) -> Iterator[bytes]:
+    """
+    Yield complete lines of ``log`` as they are written, forever.
+
+    A partly written last line is held back until its newline arrives. If
+    the file shrinks (truncated or rewritten) it is read again from the start.
+    """
+    partial = b""
+    while True:
+        ln = log.readline()
+        if not ln:
+            if os.fstat(log.fileno()).st_size < log.tell():
+                log.seek(0)
+                partial = b""
+            time.sleep(poll)
+            continue
+        if not ln.endswith(b"\n"):
+            partial += ln
+            continue
+        yield partial + ln
+        partial = b""
+
+
+def plot(seq: Sequence) -> None:
+    """Timing jitter plots of one sequence."""
+    import matplotlib.pyplot as plt
+    plt.ion()
+
+    loop = loop_times(seq)
+    archon = archon_deltas(seq)
+    stats = perf.describe(loop, percentiles=())
+    fig, axs = plt.subplots(2,3, figsize=(8.6, 7.7))
+
+    # Loop Time vs Iteration Full
+    axs[0,0].plot(loop, 'o', markersize=2)
+    axs[0,0].set_title('Full Scale')
+    axs[0,0].set_xlabel('Loop Iteration'); axs[0,0].set_ylabel('Runtime [us]')
+
+    # Loop Time Histogram Full
+    counts, edges = perf.histogram(loop, bins=20)
+    axs[0,1].stairs(counts, edges, fill=True)
+    axs[0,1].set_title('Full Scale')
+    axs[0,1].set_xlabel('Loop Time [us]'); axs[0,1].set_ylabel('Occurrences')
+
+    # Loop Time vs Iteration Zoom
+    axs[1,0].plot(loop, 'o', markersize=2)
+    axs[1,0].set_title('Zoom In')
+    axs[1,0].set_xlabel('Loop Iteration'); axs[1,0].set_ylabel('Runtime [us]')
+    axs[1,0].set_ylim(900, 1200)
+
+    # Loop Time Histogram Zoom
+    axs[1,1].stairs(counts, edges, fill=True)
+    axs[1,1].set_title('Zoom In')
+    axs[1,1].set_xlabel('Loop Time [us]'); axs[1,1].set_ylabel('Occurrences')
+    axs[1,1].set_ylim(0, 100)
+
+    # Archon timestamp deltas
+    axs[0,2].plot(archon, 'o', markersize=2)
+    axs[0,2].set_title('Full Scale Archon times')
+    axs[0,2].set_xlabel('Loop Iteration'); axs[0,2].set_ylabel('Runtime [us]')
+
+    fig.suptitle(f'Camerad Log File\nStatistics - STD={stats.std:0.2f}us Mean={stats.mean:0.2f}us')
+    plt.tight_layout()
+
+
+def analyze(path: str, show: bool = True) -> Optional[Sequence]:
+    """Report every sequence of the log at ``path``; plots the last one."""
+    last = None
+    print("")
+    with open(path, "rb") as log, open(os.path.splitext(path)[0] + ".dat", "w") as dat:
+        for seq in iter_sequences(log):
+            line = report(seq)
+            if line is not None:
+                dat.write(line)
+                last = seq
+    if show and last is not None:
+        plot(last)
+    return last
+
+
+def watch(path: str, new: bool = False, poll: float = POLL) -> None:
+    """
+    Follow the log at ``path``, reporting each sequence as it completes.
+
+    Args:
+        path: camerad log
+        new: Skip sequences that finished before the call, starting at
+            the last FASTLOADPARAM line so one in progress is still seen
+        poll: Seconds between checks for new data
+    """
+    running = RunningJitter()
+    with open(path, "rb") as log, open(os.path.splitext(path)[0] + ".dat", "a") as dat:
+        offset = 0
+        roi = (0, 0, 0, 0)
+        if new and os.fstat(log.fileno()).st_size:
+            with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                at = mm.rfind(b"FASTLOADPARAM Expose ")
+                offset = mm.rfind(b"\n", 0, at) + 1 if at >= 0 else len(mm)
+                roi = roi_before(mm, offset)
+            log.seek(offset)
+        print("Following %s (Ctrl-C to stop)" % path)
+        try:
+            for seq in iter_sequences(follow(log, poll), offset=offset, roi=roi):
+                line = report(seq)
+                if line is not None:
+                    dat.write(line)
+                    dat.flush()
+                running.update(seq)
+                running.report()
+        except KeyboardInterrupt:
+            print("")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze camerad log timing jitter")
+    parser.add_argument("log", help="camerad log file")
+    parser.add_argument("-f", "--follow", action="store_true",
+                        help="follow the log as it grows, with running statistics")
+    parser.add_argument("-n", "--new", action="store_true",
+                        help="with -f, start at the latest sequence instead of the beginning")
+    parser.add_argument("--no-plot", action="store_true", help="do not plot the last sequence")
+    args = parser.parse_args(argv)
+    if args.follow:
+        watch(args.log, new=args.new)
+    else:
+        analyze(args.log, show=not args.no_plot)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
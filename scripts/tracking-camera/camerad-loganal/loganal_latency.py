@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Correlate Archon frame timestamps, camerad reads and ZMQ receive times.
+
+    loganal_latency.py camerad.log                      # Archon vs camerad
+    loganal_latency.py camerad.log JitterResults/run.cols   # ... and the receiver
+
+Every frame is followed through four clocks and stages:
+
+    archon   Archon hardware timestamp of the frame
+    ready    camerad sees the new frame ("received currentframe")
+    read     camerad has read the image ("successfully read")
+    recv     the ZMQ subscriber received it (hispec.recorder store)
+
+The Archon counter and the log have unrelated clocks, so their offset
+(one per sequence) and drift are fitted, and archon->ready is reported as
+the residual about that fit: its spread is the jitter of the stage, its
+mean is zero by construction. ready->read is measured on the log clock.
+read->recv uses the recorder's clock marks to put receive times on the
+wall clock, so it is an absolute latency when camerad and the subscriber
+run on one host. Frames are paired by matching their intervals, and the
+offset and drift between the two clocks are fitted; "recv jitter" is the
+residual about that fit.
+
+The log may also be a store written by ``loganal.py -c``; a log is parsed
+once into <log>.cols, as loganal.py -c would.
+"""
+import argparse
+import os
+import sys
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from hispec import perf
+from hispec.columnar import ColumnWriter, load_columns
+from loganal import iter_sequences, write_columns
+
+ARCHON_TICK_NS = 10.0   # nominal Archon timestamp period (100 MHz)
+MAX_LAG = 64            # most frames the receiver may have missed at either end
+
+Tables = Dict[str, Dict[str, np.ndarray]]   # {table: {column: array}}, as load_columns()
+
+
+def load_log(path: str) -> Tables:
+    """loganal column store of ``path`` (a log or a store), building it if stale."""
+    if os.path.isdir(path):
+        return load_columns(path)
+    store = os.path.splitext(path)[0] + ".cols"
+    if not os.path.isdir(store) or os.path.getmtime(store) < os.path.getmtime(path):
+        with open(path, "rb") as log, ColumnWriter(store) as out:
+            for row, seq in enumerate(iter_sequences(log)):
+                write_columns(out, row, seq)
+    return load_columns(store)
+
+
+def frame_keys(seq: np.ndarray) -> np.ndarray:
+    """(sequence, frame within sequence) of each row, packed in one int64."""
+    seq = np.asarray(seq, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, seq[1:] != seq[:-1]])
+    rank = np.arange(len(seq)) - np.repeat(starts, np.diff(np.r_[starts, len(seq)]))
+    return (seq << 32) | rank
+
+
+def join(a: Dict[str, np.ndarray], b: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Row indices of tables ``a`` and ``b`` holding the same frames."""
+    _, ia, ib = np.intersect1d(frame_keys(a["seq"]), frame_keys(b["seq"]),
+                               assume_unique=True, return_indices=True)
+    return ia, ib
+
+
+def ns(stamps: np.ndarray) -> np.ndarray:
+    """datetime64[us] log times as int64 ns."""
+    return np.asarray(stamps).view(np.int64) * 1000
+
+
+def to_wall_clock(received: np.ndarray, clock: Optional[Dict[str, np.ndarray]]) -> np.ndarray:
+    """perf_counter_ns receive times on the wall clock, from the recorder's clock marks."""
+    received = np.asarray(received, dtype=np.int64)
+    if clock is None or not len(clock["realtime"]):
+        return received
+    real, mono = clock["realtime"].astype(np.int64), clock["monotonic"].astype(np.int64)
+    rate = 1.0
+    if len(real) > 1 and mono[-1] > mono[0]:
+        rate = (real[-1] - real[0]) / (mono[-1] - mono[0])
+    return real[0] + np.round((received - mono[0]) * rate).astype(np.int64)
+
+
+def correlate(log: Tables, zmq: Optional[Tables] = None, max_lag: int = MAX_LAG,
+              out=sys.stdout) -> Dict[str, np.ndarray]:
+    """
+    Print the clock fits and per-stage latencies; returns the latencies (us)
+    of each stage, keyed as in the report.
+    """
+    wait, fetch, archon = log["wait"], log["fetch"], log["archon"]
+    stages: Dict[str, np.ndarray] = {}
+
+    # One row per frame with its ready and read times
+    iw, ifetch = join(wait, fetch)
+    frames = {"seq": wait["seq"][iw], "ready": ns(wait["stop"][iw]),
+              "read": ns(fetch["stop"][ifetch])}
+    stages["ready->read"] = (frames["read"] - frames["ready"]) * perf.NS2US
+
+    ia, iframe = join(archon, frames)
+    if len(ia) > 1:
+        fit = perf.fit_clock(archon["timestamp"][ia], frames["ready"][iframe],
+                             groups=frames["seq"][iframe])
+        print(f"Archon -> log clock: {len(ia)} frames, {fit.slope:0.6f} ns/tick "
+              f"({fit.drift_ppm(ARCHON_TICK_NS):+0.2f} ppm from {ARCHON_TICK_NS:g} ns), "
+              f"{int(fit.rejected.sum())} outliers left out", file=out)
+        stages["archon->ready"] = fit.residuals[~fit.rejected] * perf.NS2US
+
+    if zmq is not None:
+        received = to_wall_clock(zmq["zmq"]["timestamp"], zmq.get("clock"))
+        read = frames["read"]
+        lag = perf.match_lag(read, received, max_lag)
+        first = max(0, -lag)
+        n = min(len(read) - first, len(received) - first - lag)
+        read = read[first:first + n]
+        received = received[first + lag:first + lag + n]
+        if n > 1:
+            fit = perf.fit_clock(read, received)
+            print(f"Log -> receiver clock: {n} frames paired (receiver shifted {lag:+d}), "
+                  f"drift {fit.drift_ppm():+0.2f} ppm, "
+                  f"{int(fit.rejected.sum())} outliers left out", file=out)
+            stages["read->recv"] = (received - read) * perf.NS2US
+            stages["recv jitter"] = fit.residuals[~fit.rejected] * perf.NS2US
+            if zmq.get("clock") is None:
+                print("No clock marks with the receive times: read->recv includes the clock offset",
+                      file=out)
+
+    print(f"\n{'stage [us]':14s}{'count':>9s}{'median':>11s}{'mean':>11s}{'std':>11s}"
+          f"{'MAD-sigma':>11s}{'p99':>11s}{'max':>11s}", file=out)
+    for name, latency in stages.items():
+        s = perf.describe(latency, percentiles=(99.0,))
+        print(f"{name:14s}{s.count:9d}{s.median:11.2f}{s.mean:11.2f}{s.std:11.2f}"
+              f"{s.robust_std:11.2f}{s.percentiles[99.0]:11.2f}{s.max:11.2f}", file=out)
+    return stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage latency of camerad frames")
+    parser.add_argument("log", help="camerad log file, or its loganal column store")
+    parser.add_argument("zmq", nargs="?", help="receive times: recorder store, Runner CSV or .npy")
+    parser.add_argument("--max-lag", type=int, default=MAX_LAG,
+                        help="most frames the receiver may have missed at either end")
+    args = parser.parse_args(argv)
+    zmq = None
+    if args.zmq:
+        if os.path.isdir(args.zmq):
+            zmq = load_columns(args.zmq)
+        else:
+            zmq = {"zmq": {"timestamp": perf.load_timestamps(args.zmq)}}
+    correlate(load_log(args.log), zmq, args.max_lag)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
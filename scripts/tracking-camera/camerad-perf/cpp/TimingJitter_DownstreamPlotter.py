@@ -1,81 +1,75 @@
-import numpy as np
+import sys
+
 import matplotlib.pyplot as plt
 
-# Conversions
-NS2US   = 1e-3
-NS2SEC  = 1e-9
+from hispec import perf
 
-# User Inputs
-filename    = "JitterResults/250326_Try10.csv"
+# User Inputs (a filename on the command line overrides this one)
+filename    = "JitterResults/250326_Try10.csv"  # Runner CSV, or a column store
 isPlot      = True      # Flag to plot the results
+outSig      = 8         # tolerance for outliers (number of +sigma from mean)
+MARKER_LIMIT = 100000   # Above this many points, plot single pixels instead of markers
+
+
+def points(ax, y):
+    """Plot ``y`` against its index, cheaply for long series."""
+    if len(y) > MARKER_LIMIT:
+        ax.plot(y, ',', rasterized=True)
+    else:
+        ax.plot(y, 'o', markersize=2)
+
 
-# Load the data
-timestamps = np.genfromtxt(filename)
-timedeltas = np.diff(timestamps) * NS2US
+def histogram(ax, y, bins):
+    counts, edges = perf.histogram(y, bins=bins)
+    ax.stairs(counts, edges, fill=True)
+
+
+if len(sys.argv) > 1:
+    filename = sys.argv[1]
+
+# Load the data (a CSV is converted once to a memory-mapped column store)
+timedeltas = perf.load_intervals(filename)
 
 # Compute statistics
-STD     = np.std(timedeltas)
-Mean    = np.mean(timedeltas)
+stats   = perf.describe(timedeltas)
+STD     = stats.std
+Mean    = stats.mean
 
 ######## Printed statistics
-print(f'\nSamples: {len(timestamps)} | STD: {STD:0.3f} us | Mean: {Mean:0.3f} us')
+print('')
+print(stats.format())
 
 # Check if any timedeltas were far out of form (major outliers)
-outSig = 8      # tolerance for outliers (number of +sigma from mean)
-outliers = np.where(timedeltas > Mean + outSig*STD)[0]
-if len(outliers):
-    print(f"{len(outliers)} outliers (+{outSig} sigma) were found in loop delta:")
-    for outlier in outliers:
-        print(f"\tInd: {outlier} | Delta: {timedeltas[outlier]} us")
-
-    print('Excluding the outliers, our stats improve to:')
-    inForm = np.delete(timedeltas, outliers)
-    print(f'Samples: {len(inForm)+1} | STD: {np.std(inForm):0.3f} us | Mean: {np.mean(inForm):0.3f} us')
+print(perf.outlier_report(timedeltas, perf.sigma_clip(timedeltas, outSig), outSig))
 
 ######## Plotted statistics
 if isPlot:
     plt.ion()
-    
-    # A 0-referenced time vector for X axis of plots (in seconds)
-    timeXAx = (timestamps-timestamps[0]) * NS2SEC
-
-    '''
-    plt.figure()
-    plt.plot(np.arange(len(timedeltas)), timedeltas, 'o', markersize=2)
-    plt.title(f'Time Deltas\nSamples: {len(timestamps)} | STD: {STD:0.3f} us | Mean: {Mean:0.3f} us')
-    plt.xlabel('Loop Iteration')
-    plt.ylabel('Loop Time [us]')
-
-    plt.figure()
-    plt.hist(timedeltas, bins=100)
-    plt.xlabel('Loop Time [us]')
-    plt.ylabel('Occurrences')
-    '''
 
     fig, axs = plt.subplots(2,2, figsize=(8.6, 7.7))
 
     # Loop Time vs Iteration Full
-    axs[0,0].plot(timedeltas, 'o', markersize=2)
+    points(axs[0,0], timedeltas)
     axs[0,0].set_title('Full Scale')
     axs[0,0].set_xlabel('Loop Iteration'); axs[0,0].set_ylabel('Runtime [us]')
 
     # Loop Time Histogram Full
-    axs[0,1].hist(timedeltas, bins=20)
+    histogram(axs[0,1], timedeltas, bins=20)
     axs[0,1].set_title('Full Scale')
     axs[0,1].set_xlabel('Loop Time [us]'); axs[0,1].set_ylabel('Occurrences')
 
     # Loop Time vs Iteration Full
-    axs[1,0].plot(timedeltas, 'o', markersize=2)
+    points(axs[1,0], timedeltas)
     axs[1,0].set_title('Zoom In')
     axs[1,0].set_xlabel('Loop Iteration'); axs[1,0].set_ylabel('Runtime [us]')
     axs[1,0].set_ylim(300,700)
 
     # Loop Time Histogram Full
-    axs[1,1].hist(timedeltas, bins=20)
+    histogram(axs[1,1], timedeltas, bins=20)
     axs[1,1].set_title('Zoom In')
     axs[1,1].set_xlabel('Loop Time [us]'); axs[1,1].set_ylabel('Occurrences')
     axs[1,1].set_ylim(0, 100)
 
 
-    fig.suptitle(f'ZMQ Reciever End\nStatistics - STD={np.std(timedeltas):0.2f}us Mean={timedeltas.mean():0.2f}us')
+    fig.suptitle(f'ZMQ Reciever End\nStatistics - STD={STD:0.2f}us Mean={Mean:0.2f}us')
     plt.tight_layout()
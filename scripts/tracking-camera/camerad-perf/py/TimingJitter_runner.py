@@ -4,17 +4,21 @@
 # This file is based on xsub-socket.py by Mike
 #####
 
+import os
 import zmq
 import time
 import numpy as np
-import time
 import matplotlib.pyplot as plt
 
+from hispec import perf
+from hispec.recorder import Recorder, record_socket, POLL_MS
+
 NS2US = 1e-3        # nanosecond to microsecond conversion
 NS2SEC = 1e-9       # nanosecond to second conversion
 
 # User Inputs
-Nsamp = 5000       # Size of preallocated timestamps array (max number of samples)
+Nsamp = None        # Stop after this many samples (None: record until Ctrl-C)
+outDir = "JitterResults"    # Recordings are written here, one column store per run
 isPrint = False     # Flag to print receive messages to terminal
 isPlot = True       # Flag to plot the results
 
@@ -24,6 +28,8 @@ def main():
 
     # Create a PULL socket
     socket = context.socket(zmq.XSUB)
+    # Time out idle receives so Ctrl-C is seen without a message arriving
+    socket.setsockopt(zmq.RCVTIMEO, POLL_MS)
 
     # Bind the socket to port 5555
     socket.connect("tcp://localhost:5555")
@@ -32,61 +38,37 @@ def main():
     socket.send(b'\x01')
     print("Listening for messages on port 5555...")
 
-    # Preallocate array to hold msg read timestamps
-    timestamps = np.empty(Nsamp, dtype=int)
-    ctr = 0
-
-    # Continuously listen for incoming messages
-    try:
-        while True:
-            try:
-                message = socket.recv()
-                timestamps[ctr] = time.perf_counter_ns()
-                if isPrint: 
-                    print(f'Time: {timestamps[ctr]} - Raw data:  {message}')
-
-            except zmq.Again:
-                timestamps[ctr] = -1*time.perf_counter_ns()
-                time.sleep(5)
-                # print("Waiting for messages...")
-            
-            ctr += 1
-            # Bailout if the next read will exceed user-requested samples
-            if ctr >= Nsamp:
-                ctr -= 1
-                break
-    except KeyboardInterrupt as e:
-        print('Ctrl-C detected --- exiting reader loop')
-
-    return timestamps[:ctr]
+    # Record msg read timestamps and sizes into a ring spilled to disk
+    os.makedirs(outDir, exist_ok=True)
+    path = os.path.join(outDir, time.strftime("%y%m%d_%H%M%S") + ".cols")
+    show = None
+    if isPrint:
+        show = lambda stamp, frame: print(f'Time: {stamp} - Raw data:  {frame.bytes}')
+    print(f"Recording to {path} (Ctrl-C to stop)")
+    with Recorder(path) as recorder:
+        record_socket(socket, recorder, limit=Nsamp, on_message=show)
+    if recorder.dropped:
+        print(f"\nWARNING:::\n\t{recorder.dropped} messages were not recorded (disk too slow)")
+    socket.close()
+
+    return perf.load_timestamps(path)
 
 if __name__ == "__main__":
     timestamps = main()
     timedeltas = np.diff(timestamps) * NS2US
 
     # Compute statistics
-    STD     = np.std(timedeltas)
-    Mean    = np.mean(timedeltas)
-    Median   = np.median(timedeltas)
+    stats   = perf.describe(timedeltas)
+    STD     = stats.std
+    Mean    = stats.mean
 
     ######## Printed statistics
-    if any(timestamps < 0):
-        Nneg = np.count_nonzero(timestamps<0)
-        print(f"\nWARNING:::\n\t{Nneg} timestamps were negative, meaning recv failed sometimes")
-
-    print(f'\nSamples: {len(timestamps)} | STD: {STD:0.3f} us | Mean: {Mean:0.3f} us | Media: {Median:0.3f}')
+    print('')
+    print(stats.format())
 
     # Check if any timedeltas were far out of form (major outliers)
     outSig = 8      # tolerance for outliers (number of +sigma from mean)
-    outliers = np.where(timedeltas > Mean + outSig*STD)[0]
-    if len(outliers):
-        print(f"{len(outliers)} outliers (+{outSig} sigma) were found in loop delta:")
-        for outlier in outliers:
-            print(f"\tInd: {outlier} | Delta: {timedeltas[outlier]} us")
-
-        print('Excluding the outliers, our stats improve to:')
-        inForm = np.delete(timedeltas, outliers)
-        print(f'Samples: {len(inForm)+1} | STD: {np.std(inForm):0.3f} us | Mean: {np.mean(inForm):0.3f} us')
+    print(perf.outlier_report(timedeltas, perf.sigma_clip(timedeltas, outSig), outSig))
 
     ######## Plotted statistics
     if isPlot:
@@ -102,6 +84,7 @@ if __name__ == "__main__":
         plt.ylabel('Loop Time [us]')
 
         plt.figure()
-        plt.hist(timedeltas, bins=10)
+        counts, edges = perf.histogram(timedeltas, bins=10)
+        plt.stairs(counts, edges, fill=True)
         plt.xlabel('Loop Time [us]')
         plt.ylabel('Occurrences')
\ No newline at end of file
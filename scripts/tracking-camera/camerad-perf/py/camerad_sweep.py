@@ -0,0 +1,248 @@
+#####
+# Sweep camerad over ROI sizes, exposure times and window settings
+#
+# For every point of the grid camerad is configured over one command
+# connection, a sequence of frames is taken while the ZMQ frames are
+# recorded, and the new part of the camerad log is kept and analysed with
+# loganal. One row per point goes to <out>/sweep.cols (table "points"),
+# readable while the sweep runs, and a frame-rate model
+#     period = overhead + exptime + per_pixel * pixels
+# is fitted to the results.
+#
+#   python camerad_sweep.py run --log /path/camerad.log --sizes 10 20 50 100
+#   python camerad_sweep.py fit SweepResults/sweep.cols --baseline old/sweep.cols
+#####
+
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from hispec import perf
+from hispec.camerad import CameradClient, HOST, PORT
+from hispec.columnar import ColumnWriter, load_columns, to_records
+
+# loganal lives beside this directory
+sys.path.insert(0, str(Path(__file__).resolve().parent / "../../camerad-loganal"))
+from loganal import iter_sequences  # noqa: E402
+
+SETTLE = 0.2        # seconds to keep receiving after the sequence is complete
+TOLERANCE = 0.05    # fractional frame-rate loss flagged as a regression
+
+POINT_DTYPE = np.dtype(
+    [("point", np.int32), ("vstart", np.int32), ("vstop", np.int32),
+     ("hstart", np.int32), ("hstop", np.int32), ("pixels", np.int64),
+     ("exptime", np.float64), ("window", np.int32), ("nseq", np.int32), ("nexp", np.int32),
+     ("frame_hz", np.float64), ("loop_std_us", np.float64),
+     ("expose_hz", np.float64), ("fetch_hz", np.float64), ("wait_hz", np.float64),
+     ("zmq_count", np.int64), ("zmq_median_us", np.float64), ("zmq_std_us", np.float64),
+     ("zmq_p99_us", np.float64), ("expose_cmd_ms", np.float64)])
+
+
+def roi_grid(sizes, center):
+    """Square ROIs (vstart, vstop, hstart, hstop) of each side in ``sizes`` about ``center``."""
+    row, col = center
+    return [(row - s // 2, row - s // 2 + s - 1, col - s // 2, col - s // 2 + s - 1)
+            for s in sizes]
+
+
+def wait_for_sequence(log_path, offset, timeout):
+    """Wait until the log has a READOUT SEQUENCE COMPLETE past byte ``offset``."""
+    deadline = time.monotonic() + timeout
+    with open(log_path, "rb") as log:
+        log.seek(offset)
+        tail = b""
+        while time.monotonic() < deadline:
+            chunk = log.read()
+            if not chunk:
+                time.sleep(0.1)
+                continue
+            tail = tail[-64:] + chunk     # the message may straddle two reads
+            if b"READOUT SEQUENCE COMPLETE" in tail:
+                return True
+    return False
+
+
+def record_zmq(path, stop, endpoint):
+    """Record ZMQ arrival times into ``path`` until ``stop`` is set; runs in a thread."""
+    import zmq
+    from hispec.recorder import Recorder, record_socket, POLL_MS
+    socket = zmq.Context.instance().socket(zmq.XSUB)
+    socket.setsockopt(zmq.RCVTIMEO, POLL_MS)
+    socket.connect(endpoint)
+    socket.send(b'\x01')
+    with Recorder(path) as recorder:
+        record_socket(socket, recorder, stop=stop)
+    socket.close()
+
+
+def measure_point(point, roi, exptime, window, args, camerad, out):
+    """Run one grid point and return its POINT_DTYPE row."""
+    name = os.path.join(args.out, "point_%03d" % point)
+    camerad.pipeline([f"exptime {exptime:g}", "hroi %d %d %d %d" % roi, f"hwindow {window}"])
+
+    stop = threading.Event()
+    recorder = None
+    if not args.no_zmq:
+        recorder = threading.Thread(target=record_zmq, args=(name + ".cols", stop, args.zmq),
+                                    daemon=True)
+        recorder.start()
+        time.sleep(SETTLE)      # let the subscription reach camerad
+
+    offset = os.path.getsize(args.log)
+    reply = camerad.command(f"hexpose {args.frames}", timeout=None)
+    complete = wait_for_sequence(args.log, offset, args.timeout)
+    time.sleep(SETTLE)
+    stop.set()
+    if recorder is not None:
+        recorder.join()
+    if not complete:
+        print(f"  point {point}: no READOUT SEQUENCE COMPLETE within {args.timeout:g} s")
+
+    # Keep this point's part of the log, then analyse it
+    with open(args.log, "rb") as log:
+        log.seek(offset)
+        section = log.read()
+    with open(name + ".log", "wb") as kept:
+        kept.write(section)
+    with open(name + ".log", "rb") as log:
+        sequences = list(iter_sequences(log, roi=roi))
+
+    row = np.zeros((), dtype=POINT_DTYPE)
+    row["point"] = point
+    row["vstart"], row["vstop"], row["hstart"], row["hstop"] = roi
+    row["pixels"] = (roi[1] - roi[0] + 1) * (roi[3] - roi[2] + 1)
+    row["exptime"] = exptime
+    row["window"] = window
+    row["expose_cmd_ms"] = reply.elapsed_ms
+    for field in ("frame_hz", "loop_std_us", "expose_hz", "fetch_hz", "wait_hz",
+                  "zmq_median_us", "zmq_std_us", "zmq_p99_us"):
+        row[field] = np.nan
+    if sequences:
+        seq = sequences[-1]
+        row["nseq"], row["nexp"] = seq.nseq, seq.nexp
+        if seq.nexp > 2:
+            loop = perf.describe(np.diff(seq.read_stop) / np.timedelta64(1, "us"), percentiles=())
+            row["frame_hz"] = 1e6 / loop.median
+            row["loop_std_us"] = loop.std
+            row["expose_hz"] = seq.expose_hz().mean()
+            row["fetch_hz"] = seq.fetch_hz().mean()
+            row["wait_hz"] = seq.wait_hz().mean()
+    if recorder is not None:
+        intervals = perf.load_intervals(name + ".cols")
+        row["zmq_count"] = len(intervals) + 1 if len(intervals) else 0
+        if len(intervals):
+            stats = perf.describe(intervals, percentiles=(99.0,))
+            row["zmq_median_us"] = stats.median
+            row["zmq_std_us"] = stats.std
+            row["zmq_p99_us"] = stats.percentiles[99.0]
+    out.append_records("points", row.reshape(1))
+    return row
+
+
+def print_points(points):
+    print(f"{'pt':>3s} {'ROI':>19s} {'pixels':>8s} {'exp':>6s} {'win':>3s} {'frames':>6s}"
+          f" {'Hz':>9s} {'jitter':>8s} {'zmq med':>9s} {'zmq std':>8s}")
+    for p in points:
+        print(f"{p['point']:3d} {p['vstart']:4d} {p['vstop']:4d} {p['hstart']:4d} {p['hstop']:4d}"
+              f" {p['pixels']:8d} {p['exptime']:6g} {p['window']:3d} {p['nexp']:6d}"
+              f" {p['frame_hz']:9.2f} {p['loop_std_us']:8.2f} {p['zmq_median_us']:9.2f}"
+              f" {p['zmq_std_us']:8.2f}")
+
+
+def fit_points(points, exptime_unit):
+    """Frame-rate model of the points that have a frame rate."""
+    return perf.fit_frame_rate(points["pixels"], points["frame_hz"],
+                               points["exptime"] * exptime_unit)
+
+
+def check_baseline(points, baseline, exptime_unit, tolerance):
+    """
+    Compare ``points`` with the model of a baseline sweep; returns the
+    number of regressions, counting points that measured no frame rate.
+    """
+    model = fit_points(baseline, exptime_unit)
+    print("Baseline model: " + model.format())
+    exptime = points["exptime"] * exptime_unit
+    predicted = model.hz(points["pixels"], exptime)
+    change, slow = model.regressions(points["pixels"], points["frame_hz"], exptime, tolerance)
+    for i in range(len(points)):
+        if not np.isfinite(change[i]):
+            flag = "  NO DATA"
+        else:
+            flag = "  REGRESSION" if slow[i] else ""
+        print(f"  point {points['point'][i]:3d}: {points['frame_hz'][i]:9.2f} Hz, "
+              f"baseline model {predicted[i]:9.2f} Hz ({change[i] * 100:+6.1f}%){flag}")
+    return int(slow.sum())
+
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    grid = [(roi, exptime, window) for window in args.windows for exptime in args.exptimes
+            for roi in roi_grid(args.sizes, args.center)]
+    print(f"Sweeping {len(grid)} points into {args.out}")
+    with CameradClient(args.host, args.port) as camerad, \
+            ColumnWriter(os.path.join(args.out, "sweep.cols"), mapped=True) as out:
+        for point, (roi, exptime, window) in enumerate(grid):
+            row = measure_point(point, roi, exptime, window, args, camerad, out)
+            print(f"  point {point}: ROI {roi} exptime {exptime:g} hwindow {window}: "
+                  f"{row['nexp']} frames at {row['frame_hz']:0.2f} Hz")
+    return os.path.join(args.out, "sweep.cols")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="camerad ROI / exposure parameter sweep")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="drive camerad over the grid")
+    run_cmd.add_argument("--log", required=True, help="camerad log file that camerad is writing")
+    run_cmd.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 50, 100, 200],
+                         help="square ROI sides (pixels)")
+    run_cmd.add_argument("--center", type=int, nargs=2, default=[104, 104],
+                         metavar=("ROW", "COL"), help="ROI center")
+    run_cmd.add_argument("--exptimes", type=float, nargs="+", default=[0],
+                         help="exptime values given to camerad")
+    run_cmd.add_argument("--windows", type=int, nargs="+", default=[1], help="hwindow settings")
+    run_cmd.add_argument("--frames", type=int, default=1000, help="frames per point (hexpose)")
+    run_cmd.add_argument("--timeout", type=float, default=120.0,
+                         help="seconds to wait for each sequence to complete")
+    run_cmd.add_argument("--host", default=HOST, help="camerad host")
+    run_cmd.add_argument("--port", type=int, default=PORT, help="camerad command port")
+    run_cmd.add_argument("--zmq", default="tcp://localhost:5555", help="camerad ZMQ endpoint")
+    run_cmd.add_argument("--no-zmq", action="store_true", help="do not record ZMQ frames")
+    run_cmd.add_argument("--out", default="SweepResults", help="output directory")
+
+    fit_cmd = commands.add_parser("fit", help="fit and compare existing sweep results")
+    fit_cmd.add_argument("results", help="sweep.cols of a sweep")
+
+    for cmd in (run_cmd, fit_cmd):
+        cmd.add_argument("--baseline", help="sweep.cols of an earlier sweep to compare against")
+        cmd.add_argument("--tolerance", type=float, default=TOLERANCE,
+                         help="fractional frame-rate loss flagged as a regression")
+        cmd.add_argument("--exptime-unit", type=float, default=1e-3,
+                         help="seconds per camerad exptime unit")
+    args = parser.parse_args(argv)
+
+    results = run(args) if args.command == "run" else args.results
+    points = to_records(load_columns(results)["points"])
+    print("")
+    print_points(points)
+    try:
+        print("\nModel: " + fit_points(points, args.exptime_unit).format())
+    except ValueError as e:
+        print(f"\nNo model: {e}")
+        if args.baseline:
+            return 1    # nothing usable to compare: fail the regression check
+    if args.baseline:
+        baseline = to_records(load_columns(args.baseline)["points"])
+        if check_baseline(points, baseline, args.exptime_unit, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
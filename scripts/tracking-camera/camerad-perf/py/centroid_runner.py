@@ -0,0 +1,71 @@
+#####
+# Measure the spot in every camerad ZMQ image as it arrives
+#
+# Frames are decoded in place (no copy of the pixels) and measured on a
+# worker thread; each result is republished as one RESULT_DTYPE record on
+# a PUB socket, and arrival times are recorded as by TimingJitter_runner.
+#####
+
+import os
+import zmq
+import time
+import numpy as np
+
+from hispec import perf
+from hispec.frames import FramePipeline, Geometry, RESULT_DTYPE
+from hispec.recorder import Recorder, record_socket, POLL_MS
+
+# User Inputs
+hroi = "100 109 100 109"    # ROI given to camerad with hroi (vstart vstop hstart hstop)
+Nsamp = None        # Stop after this many frames (None: run until Ctrl-C)
+pubAddr = "tcp://*:5556"    # Results are published here
+outDir = "JitterResults"    # Arrival times are recorded here, one column store per run
+isPrint = False     # Flag to print every result to terminal
+
+def main():
+    context = zmq.Context()
+
+    # Subscribe to all camerad frames
+    socket = context.socket(zmq.XSUB)
+    socket.setsockopt(zmq.RCVTIMEO, POLL_MS)
+    socket.connect("tcp://localhost:5555")
+    socket.send(b'\x01')
+    print("Listening for frames on port 5555...")
+
+    # Publish results as raw RESULT_DTYPE records
+    results = context.socket(zmq.PUB)
+    results.bind(pubAddr)
+    print(f"Publishing centroids on {pubAddr} as {RESULT_DTYPE.descr}")
+
+    def publish(result):
+        results.send(result.tobytes(), zmq.NOBLOCK)
+        if isPrint:
+            print(f"{result['seq']:8d}  x {result['x']:9.3f}  y {result['y']:9.3f}  "
+                  f"flux {result['flux']:10.1f}  bkg {result['background']:7.1f}  "
+                  f"latency {(result['done'] - result['received']) * perf.NS2US:8.1f} us")
+
+    pipeline = FramePipeline(Geometry.from_hroi(hroi), publish=publish)
+    os.makedirs(outDir, exist_ok=True)
+    path = os.path.join(outDir, time.strftime("%y%m%d_%H%M%S") + ".cols")
+    print(f"Recording to {path} (Ctrl-C to stop)")
+    with Recorder(path) as recorder:
+        record_socket(socket, recorder, limit=Nsamp, on_message=pipeline.submit)
+    pipeline.close()
+    socket.close()
+    results.close()
+    return pipeline, path
+
+if __name__ == "__main__":
+    pipeline, path = main()
+    latency = pipeline.latency
+
+    print('')
+    print(f"Frames measured: {pipeline.measured} | dropped: {pipeline.dropped} "
+          f"| undecodable: {pipeline.errors}")
+    if latency.count:
+        print(f"Receive to result latency [us]: median {latency.median:0.1f} "
+              f"| mean {latency.moments.mean:0.1f} | p99 {latency.quantile(0.99):0.1f} "
+              f"| max {latency.moments.max:0.1f}")
+    timestamps = perf.load_timestamps(path)
+    if len(timestamps) > 1:
+        print(perf.describe(np.diff(timestamps) * perf.NS2US).format())
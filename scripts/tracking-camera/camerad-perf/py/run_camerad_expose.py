@@ -1,56 +1,43 @@
-import subprocess
 import time
 import csv
-from pathlib import Path
 
-# Define path socksend
-SOCKSEND_PATH = Path(__file__).resolve().parent / "../camera-interface/bin/socksend"
+from hispec.camerad import CameradClient, CameradError
 
-def execute_commands(commands):
-    """Execute a list of shell commands."""
+# camerad command port
+CAMERAD_HOST = "localhost"
+CAMERAD_PORT = 3031
 
-    for command in commands:
-        try:
-            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
+def execute_commands(camerad, commands):
+    """Send a list of camerad commands in one write and report each reply."""
 
-            if process.returncode == 0:
-                print(f"Command '{command}' executed successfully")
-            else:
-                print(f"Command '{command}' failed with exit code {process.returncode}.")
-        except FileNotFoundError:
-            print(f"Command '{command}' not found.")
-        except Exception as e:
-            print(f"An error occurred while executing '{command}': {e}")
+    for reply in camerad.pipeline(commands, check=False):
+        if reply.ok:
+            print(f"Command '{reply.command}' executed successfully")
+        else:
+            print(f"Command '{reply.command}' failed: {reply.text}")
 
 
-def execute_timed_commands(commands, n, csv_filename="command_times.csv"):
+def execute_timed_commands(camerad, commands, n, csv_filename="command_times.csv"):
     """
-    Executes a list of shell commands
+    Executes a list of camerad commands n times, timing each one
     """
     results = []
 
     start_total = time.time()
     for i in range(n):
         for command in commands:
-            start_time = time.time()
             try:
-                process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                stdout, stderr = process.communicate()
-                end_time = time.time()
-                execution_time = end_time - start_time
-                return_code = process.returncode
+                reply = camerad.command(command, check=False, timeout=None)
+                execution_time = reply.elapsed_ms * 1e-3
+                return_code = 0 if reply.ok else 1
 
                 print(f"  Command '{command}' executed in {execution_time:.4f} seconds")
                 results.append([i + 1, command, execution_time, return_code])
-                
-            except FileNotFoundError:
-                print(f"Command '{command}' not found.")
-                results.append([i + 1, command, "Error", "Error"])
-            except Exception as e:
+
+            except (OSError, CameradError) as e:
                 print(f"An error occurred while executing '{command}': {e}")
                 results.append([i + 1, command, "Error", "Error"])
-                
+
 
     end_total = time.time()
     total_execution_time = end_total - start_total
@@ -64,21 +51,22 @@ def execute_timed_commands(commands, n, csv_filename="command_times.csv"):
 if __name__ == "__main__":
 
     prep_commands = [
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'open'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'load'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'power on'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'setp Start 1'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'exptime 0'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'hsetup'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'hroi 100 109 100 109'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'hwindow 1'",
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'zmq 1'"
-        # f"{SOCKSEND_PATH} -h localhost -p 3031 'autofetch 1'"
+        "open",
+        "load",
+        "power on",
+        "setp Start 1",
+        "exptime 0",
+        "hsetup",
+        "hroi 100 109 100 109",
+        "hwindow 1",
+        "zmq 1"
+        # "autofetch 1"
     ]
 
     take_exposures = [
-        f"{SOCKSEND_PATH} -h localhost -p 3031 'hexpose 1000'"
+        "hexpose 1000"
     ]
 
-    execute_commands(prep_commands)
-    execute_timed_commands(take_exposures, 1)
+    with CameradClient(CAMERAD_HOST, CAMERAD_PORT) as camerad:
+        execute_commands(camerad, prep_commands)
+        execute_timed_commands(camerad, take_exposures, 1)
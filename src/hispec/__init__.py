@@ -6,6 +6,8 @@ from .config import (
     extract_daemon_config,
     list_daemons,
 )
+from .motion import MoveTimingModel
+from .trend import ApproachTrend, ExponentialTrend, RingBuffer, SlidingRegression
 
 __all__ = [
     "HispecDaemon",
@@ -14,4 +16,9 @@ __all__ = [
     "load_file",
     "extract_daemon_config",
     "list_daemons",
+    "MoveTimingModel",
+    "SlidingRegression",
+    "ExponentialTrend",
+    "RingBuffer",
+    "ApproachTrend",
 ]
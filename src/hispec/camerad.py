@@ -0,0 +1,150 @@
+"""
+Client for the camerad command port.
+
+camerad reads newline-terminated commands on a TCP port (3031 by default)
+and answers each with text whose last line ends in DONE or ERROR. One
+connection is kept open for every command, rather than a ``socksend``
+process and connection per command, so timings measure camerad itself.
+
+Commands may be pipelined: several are written at once and their replies,
+which camerad sends in order, are matched back to them as they arrive.
+Every reply carries ``perf_counter_ns`` times of when its command was sent
+and when the read completing its reply returned. If an exchange fails part
+way (a timeout, a dropped connection), the replies still owed can no longer
+be matched to their commands, so the client closes its connection and
+refuses further commands; open a new client to carry on.
+
+Usage:
+    with CameradClient() as cam:
+        cam.command("hroi 100 109 100 109")
+        replies = cam.pipeline(["exptime 0", "hsetup", "zmq 1"])
+        cam.command("hexpose 1000", timeout=None).elapsed_ms
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import socket
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+HOST = "localhost"
+PORT = 3031
+TIMEOUT = 30.0          # seconds to wait for a reply
+TERMINATORS = (b"DONE", b"ERROR")
+CLIENT_TIMEOUT = -1.0   # per-command timeout meaning "the client's timeout"
+
+
+class CameradError(RuntimeError):
+    """camerad answered a command with ERROR."""
+
+    def __init__(self, reply: "Reply"):
+        super().__init__(f"camerad command {reply.command!r} failed: {reply.text!r}")
+        self.reply = reply
+
+
+@dataclass
+class Reply:
+    """camerad's answer to one command."""
+    command: str
+    text: str           # reply without the trailing DONE/ERROR
+    ok: bool            # False when camerad answered ERROR
+    sent: int           # perf_counter_ns when the command was written
+    done: int           # perf_counter_ns when the reply was complete
+
+    @property
+    def elapsed_ms(self) -> float:
+        """Milliseconds from sending the command to the end of its reply."""
+        return (self.done - self.sent) * 1e-6
+
+
+class CameradClient:
+    """One persistent connection to camerad's command port."""
+
+    def __init__(self, host: str = HOST, port: int = PORT, timeout: Optional[float] = TIMEOUT):
+        """
+        Args:
+            host: camerad host
+            port: Command port
+            timeout: Default seconds to wait for each reply (None: forever)
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+        self._arrivals: List[Tuple[int, int]] = []     # (end in _buffer, ns) of each read
+        self.broken: Optional[BaseException] = None     # why the connection was given up
+
+    def __enter__(self) -> "CameradClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def command(self, command: str, check: bool = True, timeout: Optional[float] = CLIENT_TIMEOUT) -> Reply:
+        """
+        Send one command and wait for its reply.
+
+        Args:
+            command: camerad command line, e.g. "hroi 100 109 100 109"
+            check: Raise CameradError if camerad answers ERROR
+            timeout: Seconds to wait (None: forever; default: the client's)
+        """
+        return self.pipeline([command], check, timeout)[0]
+
+    def pipeline(self, commands: Sequence[str], check: bool = True,
+                 timeout: Optional[float] = CLIENT_TIMEOUT) -> List[Reply]:
+        """
+        Send ``commands`` in one write, then collect their replies in order.
+
+        With ``check``, CameradError is raised for the first ERROR reply,
+        after every reply has been read so the connection stays in step.
+        """
+        if self.broken is not None:
+            raise ConnectionError(f"camerad connection was given up after: {self.broken!r}")
+        if timeout == CLIENT_TIMEOUT:
+            timeout = self.timeout
+        payload = b"".join(c.encode() + b"\n" for c in commands)
+        try:
+            self._sock.settimeout(timeout)
+            sent = time.perf_counter_ns()
+            self._sock.sendall(payload)
+            replies = [self._read_reply(command, sent) for command in commands]
+        except BaseException as e:
+            # Replies may still be owed: later ones would answer the wrong commands
+            self.broken = e
+            self._buffer.clear()
+            self._arrivals.clear()
+            self.close()
+            raise
+        if check:
+            for reply in replies:
+                if not reply.ok:
+                    raise CameradError(reply)
+        return replies
+
+    def _read_reply(self, command: str, sent: int) -> Reply:
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                chunk = self._sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError(f"camerad closed the connection awaiting {command!r}")
+                self._buffer += chunk
+                self._arrivals.append((len(self._buffer), time.perf_counter_ns()))
+                continue
+            line_start, start = start, end + 1
+            words = bytes(self._buffer[line_start:end]).rsplit(None, 1)
+            if words and words[-1] in TERMINATORS:
+                # The reply was complete when the read holding its last byte returned
+                done = next(t for stop, t in self._arrivals if stop >= start)
+                self._arrivals = [(stop - start, t) for stop, t in self._arrivals if stop > start]
+                text = bytes(self._buffer[:line_start]) + (words[0] if len(words) > 1 else b"")
+                del self._buffer[:start]
+                return Reply(command, text.decode(errors="replace").strip(),
+                             words[-1] == b"DONE", sent, done)
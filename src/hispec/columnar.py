@@ -0,0 +1,200 @@
+"""
+Columnar on-disk tables of NumPy arrays, written incrementally and read back
+memory-mapped.
+
+A store is a directory holding one sub-directory per table and one ``.npy``
+file per column, so each column can be opened with ``np.load(mmap_mode="r")``
+and only the pages actually used are read. Columns are appended to as data
+arrives; the ``.npy`` header is rewritten with the final length on close.
+Mapped columns (``ColumnWriter(path, mapped=True)``) are instead written
+through a memory map grown in large steps, and their header is updated
+after every append so the rows written so far can be read while the
+writer is still running.
+
+Usage:
+    with ColumnWriter("run.cols") as out:
+        out.append("frames", seq=np.zeros(3, np.int32), stamp=stamps)
+    frames = load_columns("run.cols")["frames"]
+    frames["stamp"][-1000:]     # memory-mapped
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import mmap
+import os
+import struct
+from typing import Dict, Optional
+
+import numpy as np
+
+# Bytes reserved for each .npy header, so it can be rewritten in place
+# with the final shape
+HEADER_SIZE = 128
+
+# Bytes a mapped column grows by whenever it fills
+MAP_STEP = 1 << 24
+
+
+def _header(dtype: np.dtype, length: int) -> bytes:
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), length)
+    prefix = np.lib.format.magic(1, 0) + struct.pack("<H", HEADER_SIZE - 10)
+    header = header.ljust(HEADER_SIZE - len(prefix) - 1) + "\n"
+    if len(prefix) + len(header) != HEADER_SIZE:
+        raise ValueError(f"dtype {dtype} too complex for a column header")
+    return prefix + header.encode("latin1")
+
+
+class _ColumnFile:
+    """One ``.npy`` file grown by appending raw rows."""
+
+    def __init__(self, path: str, dtype: np.dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self) -> None:
+        self._file.seek(0)
+        self._file.write(_header(self.dtype, self.length))
+
+    def append(self, values: np.ndarray) -> None:
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(values.tobytes())
+        self.length += len(values)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._write_header()
+        self._file.close()
+
+
+class _MappedColumnFile:
+    """
+    One ``.npy`` file written through a memory map.
+
+    The file is extended by at least MAP_STEP bytes at a time, so most
+    appends are a copy into mapped pages with no system call; the header
+    length is updated after the rows are in place. The spare tail is cut
+    off on close.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._file = open(path, "w+b")
+        self._map: Optional[mmap.mmap] = None
+        self._grow(HEADER_SIZE)
+        self._map[:HEADER_SIZE] = _header(self.dtype, 0)
+
+    def _grow(self, size: int) -> None:
+        size = max(size, HEADER_SIZE + MAP_STEP)
+        if self._map is not None:
+            size = max(size, len(self._map) + MAP_STEP)
+            self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def append(self, values: np.ndarray) -> None:
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        start = HEADER_SIZE + self.length * self.dtype.itemsize
+        stop = start + values.nbytes
+        if stop > len(self._map):
+            self._grow(stop)
+        self._map[start:stop] = values.view(np.uint8)
+        self.length += len(values)
+        self._map[:HEADER_SIZE] = _header(self.dtype, self.length)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._map.close()
+        self._file.truncate(HEADER_SIZE + self.length * self.dtype.itemsize)
+        self._file.close()
+
+
+class ColumnWriter:
+    """
+    Write tables of equal-length columns into a store directory.
+
+    The dtype of each column is fixed by its first append. Every append to
+    a table must give the same columns with the same number of rows.
+    """
+
+    def __init__(self, path: str, mapped: bool = False):
+        """
+        Args:
+            path: Store directory; created if needed, existing columns are replaced
+            mapped: Write through memory maps, keeping the store readable
+                while it is written (see _MappedColumnFile)
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._column = _MappedColumnFile if mapped else _ColumnFile
+        self._tables: Dict[str, Dict[str, _ColumnFile]] = {}
+
+    def __enter__(self) -> "ColumnWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, table: str, **columns: np.ndarray) -> None:
+        """Append rows to ``table``, one keyword argument per column."""
+        arrays = {name: np.asarray(values) for name, values in columns.items()}
+        lengths = {len(values) for values in arrays.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"columns of {table!r} differ in length: {sorted(lengths)}")
+        files = self._tables.get(table)
+        if files is None:
+            directory = os.path.join(self.path, table)
+            os.makedirs(directory, exist_ok=True)
+            files = {name: self._column(os.path.join(directory, name + ".npy"), values.dtype)
+                     for name, values in arrays.items()}
+            self._tables[table] = files
+        elif set(files) != set(arrays):
+            raise ValueError(f"columns of {table!r} are {sorted(files)}, not {sorted(arrays)}")
+        for name, values in arrays.items():
+            files[name].append(values)
+
+    def append_records(self, table: str, records: np.ndarray) -> None:
+        """Append a structured array to ``table``, one column per field."""
+        self.append(table, **{name: records[name] for name in records.dtype.names})
+
+    def close(self) -> None:
+        """Write the final lengths into every column header."""
+        for files in self._tables.values():
+            for column in files.values():
+                column.close()
+
+
+def load_columns(path: str, mmap_mode: Optional[str] = "r") -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Open every column of the store at ``path``.
+
+    Returns {table: {column: array}}; arrays are memory-mapped unless
+    ``mmap_mode`` is None.
+    """
+    tables: Dict[str, Dict[str, np.ndarray]] = {}
+    for table in sorted(os.listdir(path)):
+        directory = os.path.join(path, table)
+        if not os.path.isdir(directory):
+            continue
+        tables[table] = {
+            name[:-4]: np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+            for name in sorted(os.listdir(directory)) if name.endswith(".npy")
+        }
+    return tables
+
+
+def to_records(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Copy a table's columns into one structured array."""
+    names = list(columns)
+    out = np.empty(len(columns[names[0]]) if names else 0,
+                   dtype=[(name, columns[name].dtype) for name in names])
+    for name in names:
+        out[name] = columns[name]
+    return out
@@ -0,0 +1,194 @@
+"""
+Decode camerad ZMQ image frames and measure the spot in each one.
+
+camerad publishes every fetched image as a ZMQ message whose last
+``rows * cols * 2`` bytes are the little-endian 16-bit pixels of the
+region of interest set with ``hroi`` (any header comes before them). The
+frame is wrapped in a NumPy view of the received buffer, with no copy, and
+the spot is measured with a few whole-array operations into buffers that
+are allocated once per geometry.
+
+Measuring happens on a worker thread fed by the receiving thread, so the
+socket is always drained; each result carries the receive and finish times
+and the pipeline keeps running statistics of the latency between them.
+
+Usage:
+    pipeline = FramePipeline(Geometry.from_hroi("100 109 100 109"), publish=print)
+    with Recorder("run.cols") as rec:
+        record_socket(socket, rec, on_message=pipeline.submit)
+    pipeline.close()
+    pipeline.latency.median     # us
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+
+from .running import RunningSummary
+
+PIXEL = np.dtype("<u2")     # camerad pixel type
+BACKLOG = 256               # frames queued for the worker before new ones are dropped
+
+# One measured frame: sequence number, receive and finish times (ns,
+# perf_counter_ns), centroid in detector pixels, background-subtracted
+# flux and background level (counts)
+RESULT_DTYPE = np.dtype([
+    ("seq", np.int64), ("received", np.int64), ("done", np.int64),
+    ("x", np.float64), ("y", np.float64), ("flux", np.float64), ("background", np.float64)])
+
+
+@dataclass(frozen=True)
+class Geometry:
+    """Region of interest of camerad frames, as set by ``hroi``."""
+
+    vstart: int
+    vstop: int
+    hstart: int
+    hstop: int
+    dtype: np.dtype = PIXEL
+
+    @classmethod
+    def from_hroi(cls, args: Union[str, Tuple[int, int, int, int]], dtype=PIXEL) -> "Geometry":
+        """Geometry from ``hroi`` arguments, "vstart vstop hstart hstop" or a tuple."""
+        if isinstance(args, str):
+            args = args.split()
+        vstart, vstop, hstart, hstop = (int(v) for v in args)
+        return cls(vstart, vstop, hstart, hstop, np.dtype(dtype))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(rows, columns) of a frame."""
+        return self.vstop - self.vstart + 1, self.hstop - self.hstart + 1
+
+    @property
+    def nbytes(self) -> int:
+        rows, cols = self.shape
+        return rows * cols * np.dtype(self.dtype).itemsize
+
+
+def decode(buffer, geometry: Geometry) -> np.ndarray:
+    """
+    Image in the trailing pixels of ``buffer``, as a read-only view.
+
+    ``buffer`` is anything exporting the buffer protocol: bytes, a
+    memoryview, or the ``buffer`` of a ``zmq.Frame`` received with
+    ``copy=False``. The view keeps the buffer alive.
+    """
+    view = memoryview(buffer)
+    size = view.nbytes
+    if size < geometry.nbytes:
+        raise ValueError(f"frame of {size} bytes is smaller than its "
+                         f"{geometry.shape[0]}x{geometry.shape[1]} ROI ({geometry.nbytes} bytes)")
+    pixels = np.frombuffer(view.cast("B"), dtype=geometry.dtype,
+                           count=geometry.shape[0] * geometry.shape[1],
+                           offset=size - geometry.nbytes)
+    return pixels.reshape(geometry.shape)
+
+
+class SpotMeter:
+    """
+    Centroid, flux and background of one spot per frame.
+
+    The background is the median of the frame's outermost pixels; the
+    centroid is the mean position weighted by the positive
+    background-subtracted signal, whose sum is the flux. A frame with no
+    signal gives a NaN centroid.
+    """
+
+    def __init__(self, geometry: Geometry):
+        rows, cols = geometry.shape
+        if rows < 3 or cols < 3:
+            raise ValueError(f"ROI {rows}x{cols} is too small to measure a background")
+        self.geometry = geometry
+        self._signal = np.empty((rows, cols), dtype=np.float64)
+        self._row_pos = np.arange(rows, dtype=np.float64) + geometry.vstart
+        self._col_pos = np.arange(cols, dtype=np.float64) + geometry.hstart
+        flat = np.arange(rows * cols).reshape(rows, cols)
+        self._edge = np.concatenate((flat[0], flat[-1], flat[1:-1, 0], flat[1:-1, -1]))
+        self._edge_values = np.empty(len(self._edge), dtype=geometry.dtype)
+
+    def measure(self, image: np.ndarray) -> Tuple[float, float, float, float]:
+        """(x, y, flux, background) of ``image``, in detector pixels and counts."""
+        signal = self._signal
+        np.take(image, self._edge, out=self._edge_values)
+        background = float(np.median(self._edge_values))
+        np.subtract(image, background, out=signal)
+        np.maximum(signal, 0.0, out=signal)
+        flux = float(signal.sum())
+        if flux <= 0.0:
+            return np.nan, np.nan, 0.0, background
+        y = float(signal.sum(axis=1) @ self._row_pos) / flux
+        x = float(signal.sum(axis=0) @ self._col_pos) / flux
+        return x, y, flux, background
+
+
+class FramePipeline:
+    """
+    Measure frames on a worker thread as they are received.
+
+    ``submit`` is called by the receiving thread (it fits the ``on_message``
+    hook of hispec.recorder.record_socket) and only queues the frame. The
+    worker decodes and measures it, then calls ``publish`` with a one-row
+    RESULT_DTYPE record. If the worker falls ``backlog`` frames behind, new
+    frames are counted in ``dropped`` rather than queued.
+    """
+
+    def __init__(self, geometry: Geometry, publish: Optional[Callable[[np.void], None]] = None,
+                 backlog: int = BACKLOG, clock: Callable[[], int] = time.perf_counter_ns):
+        """
+        Args:
+            geometry: ROI of the incoming frames
+            publish: Called with each result (from the worker thread)
+            backlog: Frames that may wait for the worker
+            clock: Nanosecond clock, the same one that stamps ``submit``
+        """
+        self.geometry = geometry
+        self.publish = publish
+        self.clock = clock
+        self.meter = SpotMeter(geometry)
+        self.latency = RunningSummary()     # receive to result, us
+        self.measured = 0
+        self.dropped = 0
+        self.errors = 0
+        self._seq = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=backlog)
+        self._worker = threading.Thread(target=self._work, name="frame-pipeline", daemon=True)
+        self._worker.start()
+
+    def submit(self, received: int, frame) -> None:
+        """Queue ``frame`` (a zmq.Frame or buffer) received at ``received`` ns."""
+        self._seq += 1
+        try:
+            self._queue.put_nowait((self._seq, received, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Measure every queued frame, then stop the worker."""
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            seq, received, frame = item
+            try:
+                image = decode(getattr(frame, "buffer", frame), self.geometry)
+                x, y, flux, background = self.meter.measure(image)
+            except ValueError:
+                self.errors += 1
+                continue
+            done = self.clock()
+            self.measured += 1
+            self.latency.add((done - received) * 1e-3)
+            if self.publish is not None:
+                self.publish(np.array((seq, received, done, x, y, flux, background),
+                                      dtype=RESULT_DTYPE)[()])
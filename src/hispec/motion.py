@@ -0,0 +1,173 @@
+"""
+Move-duration model shared by the motion daemons.
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class _LinearFit:
+    """Running least-squares fit of duration = settle + distance / velocity."""
+
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self):
+        self.n = 0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+
+    def add(self, x: float, y: float, forget: float) -> None:
+        """Add one sample, exponentially down-weighting older ones by ``forget``."""
+        self.n += 1
+        self.sx = forget * self.sx + x
+        self.sy = forget * self.sy + y
+        self.sxx = forget * self.sxx + x * x
+        self.sxy = forget * self.sxy + x * y
+
+    def coefficients(self, weight: float) -> Optional[Tuple[float, float]]:
+        """Return (settle, seconds per unit distance), or None if underdetermined."""
+        if self.n == 0:
+            return None
+        det = weight * self.sxx - self.sx * self.sx
+        if self.n < 2 or abs(det) < 1e-12:
+            # A single distance so far: attribute everything to travel
+            if self.sx <= 0:
+                return self.sy / weight, 0.0
+            return 0.0, self.sy / self.sx
+        slope = (weight * self.sxy - self.sx * self.sy) / det
+        intercept = (self.sy - slope * self.sx) / weight
+        return max(intercept, 0.0), max(slope, 0.0)
+
+
+class MoveTimingModel:
+    """
+    Learn how long moves take, per axis and direction, from the moves actually made.
+
+    Each axis keeps a running linear fit of duration against distance, so the
+    fit costs O(1) per move. Until an axis has history, predictions come from
+    the configured ``velocity`` and ``settle`` defaults.
+
+    Usage:
+        model = MoveTimingModel(velocity=8.0, settle=0.2)
+        model.start("1", distance=target - current)
+        ...issue the move...
+        model.wait("1", done=lambda: not stage.is_moving(), timeout=60)
+        model.eta("1")  # seconds remaining on the active move
+    """
+
+    def __init__(self, velocity: Optional[float] = None, settle: float = 0.0,
+                 forget: float = 0.98, margin: float = 0.1):
+        """
+        Args:
+            velocity: Default speed (units/s) used before an axis has history
+            settle: Default settle time (s) used before an axis has history
+            forget: Per-sample decay of old moves, so drift in the hardware is tracked
+            margin: Fraction of the predicted duration at which completion polling starts
+        """
+        self.velocity = velocity
+        self.settle = settle
+        self.forget = forget
+        self.margin = margin
+        self._fits: Dict[Tuple[Hashable, bool], _LinearFit] = {}
+        self._active: Dict[Hashable, Tuple[float, float, float]] = {}
+        self._expected: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def predict(self, axis: Hashable, distance: float) -> Optional[float]:
+        """Return the predicted duration (s) of a move of ``distance`` on ``axis``."""
+        span = abs(distance)
+        with self._lock:
+            fit = self._fits.get((axis, distance >= 0))
+            coeffs = fit.coefficients(self._weight(fit)) if fit else None
+        if coeffs is not None:
+            settle, pace = coeffs
+            return settle + pace * span
+        if self.velocity:
+            return self.settle + span / self.velocity
+        return None
+
+    def record(self, axis: Hashable, distance: float, duration: float) -> None:
+        """Add a completed move to the fit for its axis and direction."""
+        if duration < 0:
+            return
+        with self._lock:
+            fit = self._fits.setdefault((axis, distance >= 0), _LinearFit())
+            fit.add(abs(distance), duration, self.forget)
+
+    def start(self, axis: Hashable, distance: float) -> Optional[float]:
+        """Mark a move as commanded now; return its predicted duration."""
+        expected = self.predict(axis, distance)
+        with self._lock:
+            self._expected[axis] = -1.0 if expected is None else expected
+            self._active[axis] = (time.monotonic(), distance, self._expected[axis])
+        return expected
+
+    def finish(self, axis: Hashable) -> Optional[float]:
+        """Mark the active move on ``axis`` complete and learn from it; return its duration."""
+        with self._lock:
+            active = self._active.pop(axis, None)
+        if active is None:
+            return None
+        started, distance, _expected = active
+        duration = time.monotonic() - started
+        self.record(axis, distance, duration)
+        return duration
+
+    def cancel(self, axis: Hashable) -> None:
+        """Forget the active move on ``axis`` without learning from it."""
+        with self._lock:
+            self._active.pop(axis, None)
+
+    def expected_duration(self, axis: Hashable) -> float:
+        """Predicted duration of the last started move; 0 if none yet, -1 if unknown."""
+        with self._lock:
+            return self._expected.get(axis, 0.0)
+
+    def eta(self, axis: Hashable) -> float:
+        """Seconds until the active move is expected to finish; 0 when idle, -1 if unknown."""
+        with self._lock:
+            active = self._active.get(axis)
+        if active is None:
+            return 0.0
+        started, _distance, expected = active
+        if expected < 0:
+            return -1.0
+        return max(expected - (time.monotonic() - started), 0.0)
+
+    def wait(self, axis: Hashable, done: Callable[[], bool], timeout: float,
+             poll: float = 0.05) -> bool:
+        """
+        Block until ``done()`` is true for the active move on ``axis``.
+
+        Sleeps through most of the predicted duration and only polls the
+        hardware near the expected finish. The move is recorded on success
+        and cancelled on timeout or error.
+
+        Returns:
+            True if the move completed within ``timeout``
+        """
+        deadline = time.monotonic() + timeout
+        remaining = self.eta(axis)
+        if remaining > 0:
+            time.sleep(min(remaining * (1.0 - self.margin), timeout))
+        try:
+            while time.monotonic() < deadline:
+                if done():
+                    self.finish(axis)
+                    return True
+                time.sleep(poll)
+        except Exception:
+            self.cancel(axis)
+            raise
+        self.cancel(axis)
+        return False
+
+    def _weight(self, fit: _LinearFit) -> float:
+        """Total weight of a fit's samples under exponential forgetting."""
+        if self.forget >= 1.0:
+            return float(fit.n)
+        return (1.0 - self.forget ** fit.n) / (1.0 - self.forget)
@@ -0,0 +1,209 @@
+"""
+Serialized request/response access to one device connection from many threads.
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple, Type
+
+HIGH = 0
+NORMAL = 5
+LOW = 9
+
+
+class RequestTimeout(TimeoutError):
+    """The request was not answered within its timeout."""
+
+
+class ConnectionLost(ConnectionError):
+    """The connection failed while the request was in flight."""
+
+
+class _Request:
+    """One queued exchange and the slot its caller waits on."""
+
+    __slots__ = ("command", "reply", "deadline", "done", "result", "error", "cancelled")
+
+    def __init__(self, command: Any, reply: bool, deadline: float):
+        self.command = command
+        self.reply = reply
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+
+
+class RequestMultiplexer:
+    """
+    Run every exchange on a shared connection from a single worker thread.
+
+    Callers in any thread submit a command and block until its reply
+    arrives, so a command and its reply are never interleaved with another
+    caller's. Requests are served in priority order (lower first, FIFO
+    within a priority). A request that times out while still queued is
+    dropped without being sent. When the connection fails it is closed and
+    reopened before the next request. So is a connection whose reply did
+    not arrive in time, so that a late reply cannot answer the next request.
+
+    The connection needs ``connect()``, ``disconnect()``, ``send(command)``
+    and ``receive(timeout=...)``, which is the SerialStream interface.
+
+    Usage:
+        mux = RequestMultiplexer(serial, fatal=(SerialStream.CommunicationError,))
+        mux.start()
+        reading = mux.request("KRDG? 0", timeout=2.0)
+        mux.request("RANGE 1,3", reply=False, priority=HIGH)
+    """
+
+    def __init__(self, connection: Any, timeout: float = 2.0,
+                 fatal: Tuple[Type[BaseException], ...] = (OSError,),
+                 on_connect: Optional[Callable[[Any], bool]] = None,
+                 reconnect_delay: float = 1.0,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            connection: Device connection with the SerialStream interface
+            timeout: Default per-request timeout (s), from submission to reply
+            fatal: Exception types that mean the connection is broken
+            on_connect: Called with the connection after each (re)connect, from
+                the worker thread; returning False counts as a failed connect
+            reconnect_delay: Seconds between reconnect attempts
+            logger: Logger for connection changes
+        """
+        self.connection = connection
+        self.timeout = timeout
+        self.fatal = fatal
+        self.on_connect = on_connect
+        self.reconnect_delay = reconnect_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.connected = False
+        self._queue: "queue.PriorityQueue[Tuple[int, int, Optional[_Request]]]" = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._next_attempt = 0.0
+
+    def start(self) -> None:
+        """Start the worker thread."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="request-mux", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker, failing anything still queued, and close the connection."""
+        self._stopping.set()
+        self._queue.put((-1, -1, None))
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def request(self, command: Any, timeout: Optional[float] = None,
+                priority: int = NORMAL, reply: bool = True) -> Any:
+        """
+        Send ``command`` and return the reply.
+
+        Args:
+            command: Passed unchanged to the connection's ``send``
+            timeout: Seconds to wait for the reply, including time spent queued
+            priority: Lower values are served first
+            reply: False for commands that are not answered; returns None
+
+        Raises:
+            RequestTimeout: if the reply did not arrive in time
+            ConnectionLost: if the connection failed or could not be opened
+        """
+        if self._stopping.is_set():
+            raise ConnectionLost("request multiplexer is stopped")
+        if timeout is None:
+            timeout = self.timeout
+        pending = _Request(command, reply, time.monotonic() + timeout)
+        self._queue.put((priority, next(self._order), pending))
+        if not pending.done.wait(timeout):
+            pending.cancelled = True
+            # The worker may have finished it in the meantime
+            if not pending.done.is_set():
+                raise RequestTimeout(f"no reply to {command!r} within {timeout:.1f} s")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self) -> None:
+        while True:
+            _priority, _order, pending = self._queue.get()
+            if pending is None or self._stopping.is_set():
+                break
+            if pending.cancelled:
+                continue
+            try:
+                pending.result = self._exchange(pending)
+            except BaseException as e: # pylint: disable=W0718
+                pending.error = e
+            pending.done.set()
+        self._drain()
+        self._disconnect()
+
+    def _exchange(self, pending: _Request) -> Any:
+        if not self.connected and not self._connect():
+            raise ConnectionLost("not connected")
+        remaining = pending.deadline - time.monotonic()
+        if remaining <= 0:
+            raise RequestTimeout(f"{pending.command!r} expired while queued")
+        try:
+            self.connection.send(pending.command)
+            if not pending.reply:
+                return None
+            return self.connection.receive(timeout=remaining)
+        except self.fatal as e:
+            self.logger.error("Connection lost: %s", e)
+            self._disconnect()
+            raise ConnectionLost(str(e)) from e
+        except Exception:
+            # The reply may still be on its way: start the next request on
+            # a fresh connection rather than read it as that one's answer.
+            self.logger.warning("No reply to %r, reconnecting", pending.command)
+            self._disconnect()
+            self._next_attempt = 0.0
+            raise
+
+    def _connect(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        self._next_attempt = now + self.reconnect_delay
+        try:
+            self.connection.connect()
+            if self.on_connect is not None and self.on_connect(self.connection) is False:
+                self._disconnect()
+                return False
+        except self.fatal as e:
+            self.logger.error("Connect failed: %s", e)
+            self._disconnect()
+            return False
+        self.connected = True
+        self.logger.info("Connected")
+        return True
+
+    def _disconnect(self) -> None:
+        self.connected = False
+        try:
+            self.connection.disconnect()
+        except Exception: # pylint: disable=W0718
+            pass
+
+    def _drain(self) -> None:
+        """Fail every request still queued at shutdown."""
+        while True:
+            try:
+                _priority, _order, pending = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if pending is not None:
+                pending.error = ConnectionLost("request multiplexer stopped")
+                pending.done.set()
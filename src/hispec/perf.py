@@ -0,0 +1,542 @@
+"""
+Timing-jitter statistics for loop, readout and message timestamps.
+
+Everything works on whole NumPy arrays: order statistics come from one
+sort, the MAD from bisection on the sorted samples, Allan deviations from
+cumulative sums, so 10^7 samples take a fraction of a second.
+
+Also a command line tool:
+    python -m hispec.perf stats JitterResults/run.csv
+    python -m hispec.perf compare before.csv after.csv
+    python -m hispec.perf allan camerad.cols
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import argparse
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+
+from .columnar import ColumnWriter, load_columns
+
+NS2US = 1e-3
+
+# Scale that makes the median absolute deviation a standard deviation
+# for normally distributed samples
+MAD_SCALE = 1.4826
+
+PERCENTILES = (1.0, 5.0, 50.0, 95.0, 99.0, 99.9)
+
+# Order statistics per sample at which two distributions are compared
+KS_GRID = 10000
+
+
+@dataclass
+class Stats:
+    """Summary of a set of samples; see describe()."""
+    count: int
+    mean: float
+    std: float
+    median: float
+    mad: float                  # median absolute deviation, unscaled
+    min: float
+    max: float
+    percentiles: Dict[float, float] = field(default_factory=dict)
+
+    @property
+    def robust_std(self) -> float:
+        """Standard deviation estimated from the MAD; insensitive to outliers."""
+        return MAD_SCALE * self.mad
+
+    def format(self, unit: str = "us") -> str:
+        """Multi-line text summary."""
+        lines = [f"Samples: {self.count} | Mean: {self.mean:0.3f} {unit} | STD: {self.std:0.3f} {unit}"
+                 f" | Median: {self.median:0.3f} {unit} | MAD-sigma: {self.robust_std:0.3f} {unit}",
+                 f"Min: {self.min:0.3f} {unit} | Max: {self.max:0.3f} {unit} | Peak-to-peak:"
+                 f" {self.max - self.min:0.3f} {unit}"]
+        if self.percentiles:
+            lines.append("Percentiles: " + " | ".join(
+                f"p{q:g} {v:0.3f}" for q, v in self.percentiles.items()))
+        return "\n".join(lines)
+
+
+def describe(x: np.ndarray, percentiles: Sequence[float] = PERCENTILES) -> Stats:
+    """Mean, spread, median, MAD, extremes and ``percentiles`` of ``x``."""
+    return _describe_sorted(np.sort(np.asarray(x, dtype=np.float64).ravel()), percentiles)
+
+
+def _describe_sorted(x: np.ndarray, percentiles: Sequence[float]) -> Stats:
+    n = len(x)
+    if not n:
+        nan = float("nan")
+        return Stats(0, nan, nan, nan, nan, nan, nan, {q: nan for q in percentiles})
+    mean = float(x.mean())
+    centered = x - mean
+    std = float(np.sqrt(np.dot(centered, centered) / n))
+    median = _percentile_sorted(x, 50.0)
+    return Stats(n, mean, std, median, _mad_sorted(x, median), float(x[0]), float(x[-1]),
+                 {q: _percentile_sorted(x, q) for q in percentiles})
+
+
+def _percentile_sorted(x: np.ndarray, q: float) -> float:
+    """Percentile of sorted ``x``, interpolated as np.percentile does."""
+    pos = q / 100.0 * (len(x) - 1)
+    low = int(np.floor(pos))
+    high = min(low + 1, len(x) - 1)
+    return float(x[low] + (pos - low) * (x[high] - x[low]))
+
+
+def _mad_sorted(x: np.ndarray, center: float) -> float:
+    """
+    Median absolute deviation of sorted ``x`` without another pass.
+
+    The deviations below and above ``center`` form two sorted runs, so
+    their k-th smallest is found by bisection in O(log n).
+    """
+    n = len(x)
+    split = int(np.searchsorted(x, center))
+
+    def below(i):       # i-th smallest deviation of the samples below center
+        return center - x[split - 1 - i]
+
+    def above(j):       # j-th smallest deviation of the samples at or above center
+        return x[split + j] - center
+
+    def kth(k):
+        # Smallest i (taken from below) for which the next one from below
+        # is no smaller than the last taken from above
+        take = k + 1
+        lo, hi = max(0, take - (n - split)), min(take, split)
+        while lo < hi:
+            i = (lo + hi) // 2
+            if below(i) < above(take - i - 1):
+                lo = i + 1
+            else:
+                hi = i
+        last = []
+        if lo > 0:
+            last.append(below(lo - 1))
+        if take - lo > 0:
+            last.append(above(take - lo - 1))
+        return max(last)
+
+    if n % 2:
+        return float(kth(n // 2))
+    return float(0.5 * (kth(n // 2 - 1) + kth(n // 2)))
+
+
+def mad(x: np.ndarray, center: Optional[float] = None) -> float:
+    """Median absolute deviation of ``x`` from ``center`` (its median by default)."""
+    x = np.asarray(x, dtype=np.float64).ravel()
+    if not len(x):
+        return float("nan")
+    if center is None:
+        center = np.median(x)
+    return float(np.median(np.abs(x - center)))
+
+
+def sigma_clip(x: np.ndarray, sigma: float = 8.0, maxiters: Optional[int] = 10,
+               two_sided: bool = False, robust: bool = False) -> np.ndarray:
+    """
+    Iteratively reject samples beyond ``sigma`` deviations of the rest.
+
+    Each pass recomputes the center and spread from the samples kept so far
+    and stops when nothing more is rejected or after ``maxiters`` passes
+    (None for no limit).
+
+    Args:
+        x: Samples
+        sigma: Rejection threshold in standard deviations
+        maxiters: Most passes
+        two_sided: Also reject samples far below the center; by default only
+            slow outliers (above the center) are rejected
+        robust: Use the median and MAD-sigma instead of the mean and std
+
+    Returns:
+        Boolean mask, True for rejected samples
+    """
+    x = np.asarray(x, dtype=np.float64).ravel()
+    rejected = np.zeros(len(x), dtype=bool)
+    passes = 0
+    while maxiters is None or passes < maxiters:
+        passes += 1
+        kept = x[~rejected]
+        if len(kept) < 2:
+            break
+        if robust:
+            center = float(np.median(kept))
+            spread = MAD_SCALE * mad(kept, center)
+        else:
+            center = float(kept.mean())
+            spread = float(kept.std())
+        deviation = x - center
+        if two_sided:
+            deviation = np.abs(deviation)
+        new = (deviation > sigma * spread) & ~rejected
+        if not new.any():
+            break
+        rejected |= new
+    return rejected
+
+
+def outlier_report(x: np.ndarray, rejected: np.ndarray, sigma: float, unit: str = "us",
+                   limit: int = 10) -> str:
+    """Text summary of the samples flagged by sigma_clip, listing the ``limit`` worst."""
+    index = np.flatnonzero(rejected)
+    if not len(index):
+        return f"No outliers beyond {sigma:g} sigma"
+    worst = index[np.argsort(x[index])[::-1][:limit]]
+    lines = [f"{len(index)} outliers (beyond {sigma:g} sigma), worst {len(worst)}:"]
+    lines += [f"\tInd: {i} | Delta: {x[i]:0.3f} {unit}" for i in sorted(worst)]
+    kept = x[~rejected]
+    lines.append(f"Excluding the outliers: Samples: {len(kept)} | STD: {kept.std():0.3f} {unit}"
+                 f" | Mean: {kept.mean():0.3f} {unit}")
+    return "\n".join(lines)
+
+
+def histogram(x: np.ndarray, bins: int = 100,
+              clip: Optional[Tuple[float, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts and bin edges of ``x``.
+
+    Args:
+        bins: Number of bins
+        clip: (low, high) percentiles bounding the range, so a few extreme
+            samples do not squeeze the rest into one bin
+    """
+    x = np.asarray(x, dtype=np.float64).ravel()
+    span = None
+    if clip is not None and len(x):
+        low, high = np.percentile(x, clip)
+        span = (low, high) if high > low else None
+    return np.histogram(x, bins=bins, range=span)
+
+
+def allan_deviation(intervals: np.ndarray,
+                    m: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Overlapping Allan deviation of a series of intervals.
+
+    For each averaging length m (in samples), the intervals are averaged
+    over every run of m consecutive samples and the deviation is
+    sqrt(<(mean[k+m] - mean[k])^2> / 2). White jitter falls as 1/sqrt(m);
+    a flat or rising curve shows drift or slow wander. For long averages
+    the differences are taken every m/8 samples rather than every sample;
+    neighbouring differences are then almost identical, so little precision
+    is lost.
+
+    Args:
+        intervals: Loop or frame intervals
+        m: Averaging lengths; by default powers of two up to a third of the series
+
+    Returns:
+        (m, deviation) arrays
+    """
+    y = np.asarray(intervals, dtype=np.float64).ravel()
+    n = len(y)
+    if m is None:
+        m = 2 ** np.arange(int(np.log2(max(n // 3, 1))) + 1)
+    m = np.asarray([k for k in m if 1 <= k and 2 * k < n], dtype=np.int64)
+    sums = np.concatenate(([0.0], np.cumsum(y - y.mean())))
+    deviation = np.empty(len(m))
+    for i, k in enumerate(m):
+        step = max(1, int(k) // 8)
+        # Difference of successive m-sample means, from the cumulative sums
+        diff = sums[2 * k::step] - 2.0 * sums[k:-k:step] + sums[:-2 * k:step]
+        deviation[i] = np.sqrt(0.5 * np.dot(diff, diff) / len(diff)) / k
+    return m, deviation
+
+
+def jitter(timestamps: np.ndarray) -> Dict[str, float]:
+    """
+    Jitter metrics of a series of event times.
+
+    Returns period_rms (std of the intervals), cycle_rms (std of the change
+    between successive intervals), peak_to_peak (range of the intervals)
+    and tie_rms (rms time-interval error: deviation of the events from a
+    straight-line fit of time against event number), all in the units of
+    ``timestamps``.
+    """
+    t = np.asarray(timestamps, dtype=np.float64).ravel()
+    intervals = np.diff(t)
+    metrics = {"period_rms": float(intervals.std()) if len(intervals) else float("nan"),
+               "cycle_rms": float(np.diff(intervals).std()) if len(intervals) > 1 else float("nan"),
+               "peak_to_peak": float(np.ptp(intervals)) if len(intervals) else float("nan"),
+               "tie_rms": float("nan")}
+    if len(t) > 2:
+        # Least-squares line through (event number, time), in closed form
+        n = len(t)
+        k = np.arange(n, dtype=np.float64)
+        k -= (n - 1) / 2.0
+        offset = t - t.mean()
+        slope = np.dot(k, offset) / np.dot(k, k)
+        offset -= slope * k
+        metrics["tie_rms"] = float(np.sqrt(np.dot(offset, offset) / n))
+    return metrics
+
+
+@dataclass
+class ClockFit:
+    """Linear relation between two clocks; see fit_clock()."""
+    slope: float                # y units per x unit
+    offsets: np.ndarray         # y at x = 0, one per group
+    residuals: np.ndarray       # y minus the fit, per sample
+    rejected: np.ndarray        # samples left out of the fit
+
+    def drift_ppm(self, nominal: float = 1.0) -> float:
+        """Rate error in parts per million, against a ``nominal`` slope."""
+        return (self.slope / nominal - 1.0) * 1e6
+
+
+def fit_clock(x: np.ndarray, y: np.ndarray, groups: Optional[np.ndarray] = None,
+              sigma: float = 5.0, maxiters: int = 5) -> ClockFit:
+    """
+    Least-squares fit y = offset[group] + slope * x between two clocks.
+
+    The slope is shared and each group (e.g. exposure sequence, for a
+    counter reset at every sequence) has its own offset. Samples beyond
+    ``sigma`` MAD-sigmas of the residuals are dropped and the fit repeated,
+    so late outliers do not bend the line. Times are taken relative to the
+    first sample before converting to float, so ns epochs keep their
+    precision.
+
+    Args:
+        x, y: Paired timestamps, integers or floats
+        groups: Non-negative group number of each pair (default one group)
+        sigma: Rejection threshold for the residuals
+        maxiters: Most fits
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) != len(y) or len(x) < 2:
+        raise ValueError(f"need two or more pairs of times, not {len(x)} and {len(y)}")
+    x0, y0 = x[0], y[0]
+    xd = (x - x0).astype(np.float64)
+    yd = (y - y0).astype(np.float64)
+    groups = np.zeros(len(x), dtype=np.int64) if groups is None else np.asarray(groups)
+    ngroups = int(groups.max()) + 1
+    rejected = np.zeros(len(x), dtype=bool)
+    for _ in range(maxiters):
+        keep = ~rejected
+        count = np.bincount(groups[keep], minlength=ngroups)
+        count = np.maximum(count, 1)
+        x_mean = np.bincount(groups[keep], xd[keep], minlength=ngroups) / count
+        y_mean = np.bincount(groups[keep], yd[keep], minlength=ngroups) / count
+        xc = xd - x_mean[groups]
+        yc = yd - y_mean[groups]
+        slope = float(np.dot(xc[keep], yc[keep]) / np.dot(xc[keep], xc[keep]))
+        residuals = yc - slope * xc
+        if mad(residuals[keep]) == 0.0:
+            break
+        clipped = sigma_clip(residuals, sigma, two_sided=True, robust=True)
+        if (clipped == rejected).all():
+            break
+        rejected = clipped
+    offsets = float(y0) + y_mean - slope * (float(x0) + x_mean)
+    return ClockFit(slope, offsets, residuals, rejected)
+
+
+def match_lag(a: np.ndarray, b: np.ndarray, max_lag: int = 64) -> int:
+    """
+    Shift k pairing event a[i] with b[i + k], found from the intervals.
+
+    Two records of the same events on different clocks (say the frames
+    camerad read and the messages a subscriber received) can start at
+    different events. Each candidate shift is scored by the median absolute
+    difference of the overlapping intervals, and the best is returned.
+    """
+    da = np.diff(np.asarray(a)).astype(np.float64)
+    db = np.diff(np.asarray(b)).astype(np.float64)
+    best, best_score = 0, np.inf
+    for k in range(-max_lag, max_lag + 1):
+        lo = max(0, -k)
+        hi = min(len(da), len(db) - k)
+        if hi - lo < max(2, min(len(da), len(db)) // 2):
+            continue
+        score = float(np.median(np.abs(da[lo:hi] - db[lo + k:hi + k])))
+        if score < best_score:
+            best, best_score = k, score
+    return best
+
+
+@dataclass
+class FrameRateModel:
+    """
+    Frame period = overhead + exposure + per_pixel * pixels; see fit_frame_rate().
+
+    Times are in seconds. ``rms`` is the residual of the fit, in seconds.
+    """
+    overhead: float
+    per_pixel: float
+    rms: float
+
+    def period(self, pixels, exptime=0.0):
+        """Predicted frame period(s) for ``pixels`` read and ``exptime`` exposure."""
+        return self.overhead + self.per_pixel * np.asarray(pixels, dtype=np.float64) + exptime
+
+    def hz(self, pixels, exptime=0.0):
+        """Predicted frame rate(s)."""
+        return 1.0 / self.period(pixels, exptime)
+
+    def regressions(self, pixels, hz, exptime=0.0, tolerance: float = 0.05):
+        """
+        Compare measured frame rates with the model.
+
+        Returns the fractional change of each rate from the prediction and
+        a mask of the regressions: rates more than ``tolerance`` below the
+        prediction, and measurements with no rate at all (NaN).
+        """
+        change = np.asarray(hz, dtype=np.float64) / self.hz(pixels, exptime) - 1.0
+        return change, ~np.isfinite(change) | (change < -tolerance)
+
+    def format(self) -> str:
+        return (f"period = {self.overhead * 1e6:0.2f} us + exptime"
+                f" + {self.per_pixel * 1e9:0.3f} ns/pixel (rms {self.rms * 1e6:0.2f} us)")
+
+
+def fit_frame_rate(pixels: np.ndarray, hz: np.ndarray,
+                   exptime: Optional[np.ndarray] = None) -> FrameRateModel:
+    """
+    Least-squares FrameRateModel from measured frame rates.
+
+    The fit is done on the frame period (1/hz) less the exposure time, which
+    is linear in the number of pixels read. Measurements without a finite
+    rate are left out.
+
+    Args:
+        pixels: Pixels per frame of each measurement
+        hz: Measured frame rate
+        exptime: Exposure time (s) of each measurement (default 0)
+    """
+    pixels = np.asarray(pixels, dtype=np.float64).ravel()
+    period = 1.0 / np.asarray(hz, dtype=np.float64).ravel()
+    if exptime is not None:
+        period = period - np.asarray(exptime, dtype=np.float64).ravel()
+    good = np.isfinite(period)
+    pixels, period = pixels[good], period[good]
+    if len(pixels) < 2 or np.ptp(pixels) == 0:
+        raise ValueError("need frame rates at two or more ROI sizes")
+    design = np.column_stack((np.ones_like(pixels), pixels))
+    (overhead, per_pixel), *_ = np.linalg.lstsq(design, period, rcond=None)
+    residuals = period - design @ (overhead, per_pixel)
+    return FrameRateModel(float(overhead), float(per_pixel),
+                          float(np.sqrt(np.mean(residuals ** 2))))
+
+
+@dataclass
+class Comparison:
+    """Run-to-run comparison of two sets of samples; see compare()."""
+    a: Stats
+    b: Stats
+    ks: float           # two-sample Kolmogorov-Smirnov statistic
+    shifts: Dict[float, float] = field(default_factory=dict)   # percentile: b - a
+
+    def format(self, unit: str = "us") -> str:
+        lines = [f"{'':11s}{'A':>12s}{'B':>12s}{'B - A':>12s}"]
+        for name in ("count", "mean", "std", "median", "robust_std", "min", "max"):
+            va, vb = getattr(self.a, name), getattr(self.b, name)
+            lines.append(f"{name:11s}{va:12.3f}{vb:12.3f}{vb - va:12.3f}")
+        for q, shift in self.shifts.items():
+            lines.append(f"{'p%g' % q:11s}{self.a.percentiles[q]:12.3f}"
+                         f"{self.b.percentiles[q]:12.3f}{shift:12.3f}")
+        lines.append(f"KS statistic: {self.ks:0.4f} (0 = same distribution, 1 = disjoint); units {unit}")
+        return "\n".join(lines)
+
+
+def compare(a: np.ndarray, b: np.ndarray,
+            percentiles: Sequence[float] = PERCENTILES) -> Comparison:
+    """Compare the distributions of ``a`` and ``b``, e.g. loop times of two runs."""
+    a = np.sort(np.asarray(a, dtype=np.float64).ravel())
+    b = np.sort(np.asarray(b, dtype=np.float64).ravel())
+    sa, sb = _describe_sorted(a, percentiles), _describe_sorted(b, percentiles)
+    return Comparison(sa, sb, ks_statistic(a, b),
+                      {q: sb.percentiles[q] - sa.percentiles[q] for q in percentiles})
+
+
+def ks_statistic(a: np.ndarray, b: np.ndarray, grid: int = KS_GRID) -> float:
+    """
+    Two-sample Kolmogorov-Smirnov statistic of sorted ``a`` and ``b``.
+
+    The empirical distributions are compared at ``grid`` evenly spaced
+    order statistics of each sample rather than at every sample, which is
+    within 2/grid of the exact value.
+    """
+    if not len(a) or not len(b):
+        return float("nan")
+    points = np.concatenate([x[np.linspace(0, len(x) - 1, min(grid, len(x))).astype(np.int64)]
+                             for x in (a, b)])
+    cdf_a = np.searchsorted(a, points, side="right") / len(a)
+    cdf_b = np.searchsorted(b, points, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def load_timestamps(path: str) -> np.ndarray:
+    """
+    Event times (ns) from a timing run, memory-mapped where possible.
+
+    Accepts a TimingJitter Runner CSV (one ns timestamp per line), a .npy
+    array of ns timestamps, or a column store: its ``zmq`` timestamps, or
+    for a loganal store the completion time of each image fetch. A CSV is
+    converted once to a column store beside it (<name>.cols).
+    """
+    if os.path.isdir(path):
+        tables = load_columns(path)
+        if "zmq" in tables:
+            return tables["zmq"]["timestamp"]
+        return tables["fetch"]["stop"].view(np.int64) * 1000
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    store = os.path.splitext(path)[0] + ".cols"
+    if not os.path.isdir(store) or os.path.getmtime(store) < os.path.getmtime(path):
+        with ColumnWriter(store) as out:
+            out.append("zmq", timestamp=np.loadtxt(path, dtype=np.int64, ndmin=1))
+    return load_columns(store)["zmq"]["timestamp"]
+
+
+def load_intervals(path: str) -> np.ndarray:
+    """Intervals (us) between the events of load_timestamps()."""
+    return np.diff(load_timestamps(path)) * NS2US
+
+
+def main(argv=None, out: TextIO = sys.stdout) -> int:
+    parser = argparse.ArgumentParser(prog="python -m hispec.perf",
+                                     description="Timing-jitter statistics of timestamp files")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_cmd = commands.add_parser("stats", help="summary statistics and outliers")
+    stats_cmd.add_argument("file", help="Runner CSV, .npy or column store")
+    stats_cmd.add_argument("--sigma", type=float, default=8.0, help="outlier threshold (sigma)")
+    stats_cmd.add_argument("--robust", action="store_true", help="clip around median and MAD-sigma")
+
+    compare_cmd = commands.add_parser("compare", help="compare two runs")
+    compare_cmd.add_argument("a", help="first run")
+    compare_cmd.add_argument("b", help="second run")
+
+    allan_cmd = commands.add_parser("allan", help="Allan deviation and jitter metrics")
+    allan_cmd.add_argument("file", help="Runner CSV, .npy or column store")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        intervals = load_intervals(args.file)
+        print(describe(intervals).format(), file=out)
+        print(outlier_report(intervals, sigma_clip(intervals, args.sigma, robust=args.robust),
+                             args.sigma), file=out)
+    elif args.command == "compare":
+        print(compare(load_intervals(args.a), load_intervals(args.b)).format(), file=out)
+    else:
+        timestamps = np.asarray(load_timestamps(args.file), dtype=np.float64) * NS2US
+        for name, value in jitter(timestamps).items():
+            print(f"{name:13s}{value:12.3f} us", file=out)
+        m, deviation = allan_deviation(np.diff(timestamps))
+        print(f"{'m':>10s}{'ADEV [us]':>14s}", file=out)
+        for k, d in zip(m, deviation):
+            print(f"{k:10d}{d:14.4f}", file=out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Unbounded recording of message arrival times for long timing soaks.
+
+Arrival times (``time.perf_counter_ns``) and message sizes go into a
+preallocated ring of fixed-size segments. When a segment fills it is handed
+to a spill thread, which appends it to a memory-mapped column store
+(hispec.columnar, table ``zmq``, columns ``timestamp`` and ``size``) and
+returns it to the ring. A ``clock`` table pairs the wall clock
+(``realtime``, ns since the epoch) with ``perf_counter_ns`` (``monotonic``)
+at the start and end of the recording, so the timestamps can be put on
+the clock of other logs. The receiving thread only ever writes into arrays
+it already owns: it never allocates buffers, never waits on the disk and
+never blocks on the spill thread. If the spill thread falls behind by the
+whole ring, messages are still received but their records are counted as
+dropped rather than stalling the socket.
+
+Usage:
+    with Recorder("soak.cols") as rec:
+        record_socket(socket, rec)          # until Ctrl-C
+    intervals = perf.load_intervals("soak.cols")
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from .columnar import ColumnWriter
+
+SEGMENT = 1 << 16       # records per ring segment
+SEGMENTS = 8            # segments in the ring
+POLL_MS = 100           # receive timeout (ms) between checks for stop
+
+
+class Recorder:
+    """
+    Ring of (timestamp, size) records spilled to a column store.
+
+    ``record`` is called from one receiving thread; spilling happens on a
+    thread owned by the recorder. The store can be read while recording
+    (see ColumnWriter's ``mapped`` mode); it is complete after ``close``.
+    """
+
+    def __init__(self, path: str, segment: int = SEGMENT, segments: int = SEGMENTS):
+        """
+        Args:
+            path: Column store directory to write
+            segment: Records per segment; a segment is spilled when full
+            segments: Segments in the ring, at least two
+        """
+        if segments < 2:
+            raise ValueError("a recorder needs at least two segments")
+        self.path = path
+        self.segment = segment
+        self.timestamps = np.zeros((segments, segment), dtype=np.int64)
+        self.sizes = np.zeros((segments, segment), dtype=np.int64)
+        self.count = 0          # records kept
+        self.dropped = 0        # records lost to a full ring
+        self.error: Optional[BaseException] = None
+
+        self._free: queue.SimpleQueue = queue.SimpleQueue()
+        for i in range(1, segments):
+            self._free.put(i)
+        self._full: queue.SimpleQueue = queue.SimpleQueue()
+        self._current: Optional[int] = 0
+        self._used = 0
+        self._closed = False
+        self._writer = ColumnWriter(path, mapped=True)
+        self._mark_clock()
+        self._spiller = threading.Thread(target=self._spill, name="recorder-spill", daemon=True)
+        self._spiller.start()
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def record(self, timestamp: int, size: int) -> None:
+        """Store one record; never blocks."""
+        if self._current is None:
+            try:
+                self._current = self._free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return
+        used = self._used
+        self.timestamps[self._current, used] = timestamp
+        self.sizes[self._current, used] = size
+        self.count += 1
+        used += 1
+        if used == self.segment:
+            self._full.put((self._current, used))
+            self._current = None
+            used = 0
+        self._used = used
+
+    def flush(self) -> None:
+        """Hand the partly filled segment to the spill thread."""
+        if self._current is not None and self._used:
+            self._full.put((self._current, self._used))
+            self._current = None
+            self._used = 0
+
+    def close(self) -> None:
+        """Spill every record, then finish the store."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._spiller.is_alive():
+            self.flush()
+            self._full.put(None)
+            self._spiller.join()
+        self._mark_clock()
+        self._writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def _mark_clock(self) -> None:
+        before = time.perf_counter_ns()
+        realtime = time.time_ns()
+        after = time.perf_counter_ns()
+        self._writer.append("clock", realtime=np.array([realtime], dtype=np.int64),
+                            monotonic=np.array([(before + after) // 2], dtype=np.int64))
+
+    def _spill(self) -> None:
+        while True:
+            item = self._full.get()
+            if item is None:
+                return
+            segment, used = item
+            if self.error is None:
+                try:
+                    self._writer.append("zmq", timestamp=self.timestamps[segment, :used],
+                                        size=self.sizes[segment, :used])
+                except BaseException as e:
+                    self.error = e
+            self._free.put(segment)
+
+
+def record_socket(socket, recorder: Recorder, limit: Optional[int] = None,
+                  stop: Optional[threading.Event] = None,
+                  clock: Callable[[], int] = time.perf_counter_ns,
+                  on_message: Optional[Callable[[int, object], None]] = None) -> int:
+    """
+    Receive messages from a ZMQ ``socket`` into ``recorder``.
+
+    Frames are received without copying their payload (``copy=False``) and
+    stamped as soon as ``recv`` returns. The socket must have a receive
+    timeout (``zmq.RCVTIMEO``) for ``stop`` to be checked while idle; a
+    timeout is not recorded.
+
+    Args:
+        socket: Connected ZMQ socket
+        recorder: Destination of the (timestamp, size) records
+        limit: Stop after this many messages (None: unbounded)
+        stop: Stop once this event is set
+        clock: Nanosecond clock used for the timestamps
+        on_message: Called with (timestamp, frame) for every message
+
+    Returns the number of messages received. Ctrl-C ends the loop cleanly.
+    """
+    import zmq
+    received = 0
+    recv, record = socket.recv, recorder.record
+    try:
+        while limit is None or received < limit:
+            if stop is not None and stop.is_set():
+                break
+            try:
+                frame = recv(copy=False)
+            except zmq.Again:
+                continue
+            now = clock()
+            record(now, len(frame))
+            received += 1
+            if on_message is not None:
+                on_message(now, frame)
+    except KeyboardInterrupt:
+        pass
+    return received
@@ -0,0 +1,190 @@
+"""
+Constant-memory running statistics for unbounded streams of samples.
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+import math
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Count, mean, variance, minimum and maximum of every sample seen so far.
+
+    Single samples use Welford's update; arrays are reduced with NumPy and
+    merged with Chan's parallel formula, so both stay accurate over long
+    runs.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float) -> None:
+        """Add one sample."""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def extend(self, values: Iterable[float]) -> None:
+        """Add every sample in ``values``."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        mean = values.mean()
+        self._merge(len(values), mean, float(((values - mean) ** 2).sum()),
+                    float(values.min()), float(values.max()))
+
+    def merge(self, other: "RunningMoments") -> None:
+        """Fold the samples summarized by ``other`` into this one."""
+        if other.count:
+            self._merge(other.count, other.mean, other._m2, other.min, other.max)
+
+    def _merge(self, count: int, mean: float, m2: float, low: float, high: float) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    @property
+    def variance(self) -> float:
+        """Population variance (as ``np.var``); 0 with fewer than two samples."""
+        return self._m2 / self.count if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        """Population standard deviation (as ``np.std``)."""
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    """
+    Streaming estimate of one quantile with the P-square algorithm
+    (Jain & Chlamtac, 1985).
+
+    Five markers are kept and nudged towards their ideal positions with a
+    piecewise-parabolic fit, so memory and time per sample are constant.
+    The first five samples give the exact quantile.
+    """
+
+    def __init__(self, p: float):
+        """
+        Args:
+            p: Quantile to estimate, between 0 and 1 (0.5 is the median)
+        """
+        if not 0.0 <= p <= 1.0:
+            raise ValueError(f"quantile {p} is not between 0 and 1")
+        self.p = p
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self._step = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        """Add one sample."""
+        self.count += 1
+        q = self._heights
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self._positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._step[i]
+
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self) -> Optional[float]:
+        """Current estimate, or None before the first sample."""
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return float(np.quantile(self._heights, self.p))
+        return self._heights[2]
+
+
+class RunningSummary:
+    """
+    RunningMoments plus P2Quantile estimates of chosen quantiles.
+
+    Usage:
+        loop = RunningSummary()
+        loop.extend(np.diff(stamps))
+        loop.median, loop.quantile(0.99), loop.moments.std
+    """
+
+    def __init__(self, quantiles: Sequence[float] = (0.05, 0.5, 0.95, 0.99)):
+        """
+        Args:
+            quantiles: Quantiles to track, between 0 and 1
+        """
+        self.moments = RunningMoments()
+        self.quantiles: Dict[float, P2Quantile] = {p: P2Quantile(p) for p in quantiles}
+        if 0.5 not in self.quantiles:
+            self.quantiles[0.5] = P2Quantile(0.5)
+
+    @property
+    def count(self) -> int:
+        return self.moments.count
+
+    @property
+    def median(self) -> Optional[float]:
+        return self.quantiles[0.5].value()
+
+    def quantile(self, p: float) -> Optional[float]:
+        """Estimate of a tracked quantile ``p``."""
+        return self.quantiles[p].value()
+
+    def add(self, x: float) -> None:
+        """Add one sample."""
+        self.moments.add(x)
+        for estimator in self.quantiles.values():
+            estimator.add(x)
+
+    def extend(self, values: Iterable[float]) -> None:
+        """Add every sample in ``values``."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.moments.extend(values)
+        for estimator in self.quantiles.values():
+            add = estimator.add
+            for x in values.tolist():
+                add(x)
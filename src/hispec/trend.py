@@ -0,0 +1,284 @@
+"""
+Sliding-window trend estimators shared by the telemetry dispatchers.
+"""
+
+from __future__ import annotations # for Python 3.9 compatibility
+from collections import deque
+import math
+from typing import Deque, Optional, Tuple
+
+import numpy as np
+
+
+class SlidingRegression:
+    """
+    Least-squares line through the samples of the last ``window`` seconds.
+
+    Sums are updated as samples enter and leave the window, so each sample
+    costs O(1) however long the window is. Times are kept relative to an
+    origin that is moved up to the window from time to time, so the sums
+    stay well conditioned over long runs.
+
+    Usage:
+        fit = SlidingRegression(window=60.0)
+        fit.add(time.monotonic(), pressure)
+        fit.slope()  # units per second over the last minute
+    """
+
+    def __init__(self, window: float, min_samples: int = 2):
+        """
+        Args:
+            window: Width of the window (s); older samples are dropped
+            min_samples: Fewest samples for which a slope is reported
+        """
+        self.window = window
+        self.min_samples = max(min_samples, 2)
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._origin: Optional[float] = None
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def clear(self) -> None:
+        """Forget every sample."""
+        self._samples.clear()
+        self._origin = None
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def add(self, t: float, y: float) -> None:
+        """Add the sample ``y`` taken at time ``t`` and drop any that fell out of the window."""
+        if self._origin is None:
+            self._origin = t
+        elif t - self._origin > 10.0 * self.window:
+            self._rebase(t)
+        x = t - self._origin
+        self._samples.append((x, y))
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+        cutoff = x - self.window
+        while self._samples[0][0] < cutoff:
+            old_x, old_y = self._samples.popleft()
+            self._sx -= old_x
+            self._sy -= old_y
+            self._sxx -= old_x * old_x
+            self._sxy -= old_x * old_y
+
+    def span(self) -> float:
+        """Time (s) between the oldest and newest samples in the window."""
+        if not self._samples:
+            return 0.0
+        return self._samples[-1][0] - self._samples[0][0]
+
+    def slope(self) -> Optional[float]:
+        """Fitted rate of change (units/s), or None with too few samples."""
+        n = len(self._samples)
+        if n < self.min_samples:
+            return None
+        det = n * self._sxx - self._sx * self._sx
+        if det <= 1e-12 * max(n * self._sxx, 1.0):
+            return None
+        return (n * self._sxy - self._sx * self._sy) / det
+
+    def value_at(self, t: float) -> Optional[float]:
+        """Fitted value at time ``t``, or None with too few samples."""
+        slope = self.slope()
+        if slope is None:
+            return None
+        n = len(self._samples)
+        intercept = (self._sy - slope * self._sx) / n
+        return intercept + slope * (t - self._origin)
+
+    def _rebase(self, t: float) -> None:
+        """Move the origin to ``t`` and rebuild the sums from the window."""
+        shift = t - self._origin
+        samples = [(x - shift, y) for x, y in self._samples]
+        self.clear()
+        self._origin = t
+        for x, y in samples:
+            self._samples.append((x, y))
+            self._sx += x
+            self._sy += y
+            self._sxx += x * x
+            self._sxy += x * y
+
+
+class ExponentialTrend:
+    """
+    Time constant of an exponential approach, p = A exp(-t / tau), fitted
+    over a sliding window as a straight line through log(p).
+
+    A positive tau is a decay (pump-down); a negative tau is growth.
+    Non-positive values are skipped, since they have no logarithm.
+    """
+
+    def __init__(self, window: float, min_samples: int = 2):
+        self._fit = SlidingRegression(window, min_samples)
+
+    def __len__(self) -> int:
+        return len(self._fit)
+
+    def clear(self) -> None:
+        """Forget every sample."""
+        self._fit.clear()
+
+    def add(self, t: float, y: float) -> None:
+        """Add the sample ``y`` taken at time ``t``."""
+        if y > 0:
+            self._fit.add(t, math.log(y))
+
+    def tau(self) -> Optional[float]:
+        """Fitted time constant (s); None with too few samples or a flat trend."""
+        slope = self._fit.slope()
+        if slope is None or slope == 0:
+            return None
+        return -1.0 / slope
+
+
+class RingBuffer:
+    """Fixed-capacity NumPy ring of (time, value) samples; appends are O(1)."""
+
+    def __init__(self, capacity: int):
+        self._data = np.empty((capacity, 2))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        """Number of samples kept before the oldest are overwritten."""
+        return self._data.shape[0]
+
+    def append(self, t: float, y: float) -> None:
+        """Add a sample, overwriting the oldest once full."""
+        self._data[self._next] = (t, y)
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def back(self, k: int = 0) -> Tuple[float, float]:
+        """Return the sample ``k`` places before the newest (0 is the newest)."""
+        if not 0 <= k < self._count:
+            raise IndexError(k)
+        t, y = self._data[(self._next - 1 - k) % self.capacity]
+        return float(t), float(y)
+
+    def to_array(self) -> np.ndarray:
+        """Copy of the samples, oldest first, as an (n, 2) array of (time, value)."""
+        if self._count < self.capacity:
+            return self._data[:self._count].copy()
+        return np.roll(self._data, -self._next, axis=0)
+
+
+class ApproachTrend:
+    """
+    Exponential approach to an asymptote, y = y_inf + (y0 - y_inf) exp(-t / tau),
+    fitted over a sliding window. Used for cooldown and warmup predictions.
+
+    The local rate, taken across ``lag`` samples, is linear in the value:
+    dy/dt = (y_inf - y) / tau. A sliding regression of rate on value gives both
+    parameters with O(1) work per sample. The recent samples the rates are
+    taken from are kept in a RingBuffer of ``capacity``.
+    """
+
+    def __init__(self, window: float, lag: int = 5, min_samples: int = 5,
+                 capacity: int = 4096):
+        """
+        Args:
+            window: Width of the fit window (s)
+            lag: Samples between the two ends of each rate estimate; larger is less noisy
+            min_samples: Fewest rate estimates for which a fit is reported
+            capacity: Samples kept in the ring buffer
+        """
+        self.window = window
+        self.lag = max(lag, 1)
+        self.min_samples = max(min_samples, 2)
+        self.samples = RingBuffer(max(capacity, self.lag + 1))
+        self.level = SlidingRegression(window, min_samples)
+        self._points: Deque[Tuple[float, float, float]] = deque()
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+
+    def clear(self) -> None:
+        """Forget every sample."""
+        self.samples = RingBuffer(self.samples.capacity)
+        self.level.clear()
+        self._points.clear()
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def add(self, t: float, y: float) -> None:
+        """Add the sample ``y`` taken at time ``t``."""
+        self.samples.append(t, y)
+        self.level.add(t, y)
+        if len(self.samples) <= self.lag:
+            return
+        t0, y0 = self.samples.back(self.lag)
+        if t <= t0:
+            return
+        rate = (y - y0) / (t - t0)
+        mid = 0.5 * (y + y0)
+        self._points.append((t, mid, rate))
+        self._sx += mid
+        self._sy += rate
+        self._sxx += mid * mid
+        self._sxy += mid * rate
+        cutoff = t - self.window
+        while self._points[0][0] < cutoff:
+            _old_t, old_x, old_y = self._points.popleft()
+            self._sx -= old_x
+            self._sy -= old_y
+            self._sxx -= old_x * old_x
+            self._sxy -= old_x * old_y
+
+    def rate(self) -> Optional[float]:
+        """Straight-line rate of change (units/s) over the window."""
+        return self.level.slope()
+
+    def fit(self) -> Optional[Tuple[float, float]]:
+        """Return (asymptote, tau in s), or None without a converging approach."""
+        n = len(self._points)
+        if n < self.min_samples:
+            return None
+        mean_x = self._sx / n
+        var = self._sxx / n - mean_x * mean_x
+        if var <= 1e-12 * max(mean_x * mean_x, 1.0):
+            return None
+        slope = (self._sxy / n - mean_x * self._sy / n) / var
+        if slope >= 0:
+            return None
+        intercept = self._sy / n - slope * mean_x
+        return -intercept / slope, -1.0 / slope
+
+    def eta(self, target: float, tolerance: float = 0.0) -> Optional[float]:
+        """
+        Seconds until the value reaches ``target``.
+
+        Uses the exponential fit when there is one, and the straight-line
+        rate until then. Returns 0 when already within ``tolerance`` of the
+        target, and None when the trend will not get there.
+        """
+        if len(self.samples) == 0:
+            return None
+        _t, current = self.samples.back(0)
+        if abs(current - target) <= tolerance:
+            return 0.0
+        fit = self.fit()
+        if fit is not None:
+            asymptote, tau = fit
+            start = current - asymptote
+            end = target - asymptote
+            if start * end > 0 and abs(end) < abs(start):
+                return tau * math.log(start / end)
+            return None
+        rate = self.rate()
+        if rate is None or rate == 0 or (target - current) / rate < 0:
+            return None
+        return (target - current) / rate
@@ -0,0 +1,65 @@
+import socket
+import threading
+
+import pytest
+
+from hispec.camerad import CameradClient, CameradError
+
+
+@pytest.fixture
+def camerad():
+    """A fake camerad that answers every command line, in order, on one connection."""
+    server = socket.create_server(("127.0.0.1", 0))
+    received = []
+
+    def serve():
+        conn, _ = server.accept()
+        with conn, conn.makefile("rb") as lines:
+            for line in lines:
+                command = line.decode().strip()
+                received.append(command)
+                if command == "hang":
+                    continue
+                if command == "bad":
+                    conn.sendall(b"ERROR\n")
+                elif command == "status":
+                    conn.sendall(b"line one\nline two DONE\n")
+                else:
+                    conn.sendall(command.split()[-1].encode() + b" DONE\r\n")
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.getsockname()[1], received
+    server.close()
+
+
+def test_commands_share_one_connection(camerad):
+    port, received = camerad
+    with CameradClient("127.0.0.1", port, timeout=5) as cam:
+        reply = cam.command("exptime 5")
+        assert reply.ok and reply.text == "5" and reply.done >= reply.sent
+        assert cam.command("status").text == "line one\nline two"
+    assert received == ["exptime 5", "status"]
+
+
+def test_pipelined_replies_match_commands(camerad):
+    port, received = camerad
+    with CameradClient("127.0.0.1", port, timeout=5) as cam:
+        replies = cam.pipeline(["hroi 1 2 3 4", "bad", "zmq 1"], check=False)
+        assert [r.command for r in replies] == ["hroi 1 2 3 4", "bad", "zmq 1"]
+        assert [r.ok for r in replies] == [True, False, True]
+        assert replies[0].text == "4"
+        with pytest.raises(CameradError):
+            cam.pipeline(["bad", "hsetup"])
+        assert cam.command("open").text == "open"     # still in step after the error
+    assert received == ["hroi 1 2 3 4", "bad", "zmq 1", "bad", "hsetup", "open"]
+
+
+def test_client_is_given_up_after_a_timeout(camerad):
+    port, _ = camerad
+    with CameradClient("127.0.0.1", port, timeout=0.2) as cam:
+        with pytest.raises(socket.timeout):
+            cam.pipeline(["exptime 1", "hang"])
+        assert cam.broken is not None
+        with pytest.raises(ConnectionError):
+            cam.command("open")
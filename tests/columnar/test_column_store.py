@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from hispec.columnar import ColumnWriter, load_columns, to_records
+
+
+def test_appends_round_trip(tmp_path):
+    path = str(tmp_path / "run.cols")
+    stamps = np.arange("2025-01-01T00:00:00", 5, dtype="datetime64[us]")
+    with ColumnWriter(path) as out:
+        out.append("frames", seq=np.zeros(3, np.int32), stamp=stamps[:3])
+        out.append("frames", seq=np.ones(2, np.int32), stamp=stamps[3:])
+        out.append("sequences", nexp=np.array([3, 2]))
+    tables = load_columns(path)
+    frames = tables["frames"]
+    assert isinstance(frames["stamp"], np.memmap)
+    assert frames["seq"].tolist() == [0, 0, 0, 1, 1]
+    assert (frames["stamp"] == stamps).all()
+    assert tables["sequences"]["nexp"].tolist() == [3, 2]
+
+
+def test_structured_records(tmp_path):
+    path = str(tmp_path / "run.cols")
+    records = np.array([(1, 2.5), (2, 3.5)], dtype=[("seqno", np.int32), ("hz", np.float64)])
+    with ColumnWriter(path) as out:
+        out.append_records("sequences", records)
+    back = to_records(load_columns(path)["sequences"])
+    assert sorted(back.dtype.names) == ["hz", "seqno"]
+    assert back["hz"].tolist() == [2.5, 3.5]
+
+
+def test_empty_table(tmp_path):
+    path = str(tmp_path / "run.cols")
+    with ColumnWriter(path) as out:
+        out.append("frames", hz=np.empty(0))
+    assert len(load_columns(path)["frames"]["hz"]) == 0
+
+
+def test_mismatched_columns(tmp_path):
+    with ColumnWriter(str(tmp_path / "run.cols")) as out:
+        with pytest.raises(ValueError):
+            out.append("frames", a=np.zeros(2), b=np.zeros(3))
+        out.append("frames", a=np.zeros(2))
+        with pytest.raises(ValueError):
+            out.append("frames", b=np.zeros(2))
+
+
+def test_mapped_columns_readable_while_written(tmp_path, monkeypatch):
+    monkeypatch.setattr("hispec.columnar.MAP_STEP", 64)
+    path = str(tmp_path / "run.cols")
+    with ColumnWriter(path, mapped=True) as out:
+        out.append("zmq", timestamp=np.arange(5, dtype=np.int64))
+        assert load_columns(path)["zmq"]["timestamp"].tolist() == list(range(5))
+        out.append("zmq", timestamp=np.arange(5, 40, dtype=np.int64))
+    assert load_columns(path)["zmq"]["timestamp"].tolist() == list(range(40))
+    assert (tmp_path / "run.cols" / "zmq" / "timestamp.npy").stat().st_size == 128 + 40 * 8
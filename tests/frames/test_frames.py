@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from hispec.frames import FramePipeline, Geometry, SpotMeter, decode
+
+
+def spot(geometry, x, y, background=100.0, peak=1000.0):
+    yy, xx = np.mgrid[geometry.vstart:geometry.vstop + 1, geometry.hstart:geometry.hstop + 1]
+    image = background + peak * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / 4.0)
+    return image.astype("<u2")
+
+
+def test_decode_is_a_view_of_the_trailing_pixels():
+    geometry = Geometry.from_hroi("100 109 200 214")
+    image = spot(geometry, 205, 104)
+    buffer = bytearray(b"head" + image.tobytes())
+    decoded = decode(buffer, geometry)
+    assert decoded.shape == (10, 15)
+    assert (decoded == image).all()
+    assert np.shares_memory(decoded, np.frombuffer(buffer, np.uint8))
+
+
+def test_decode_rejects_short_frames():
+    with pytest.raises(ValueError):
+        decode(b"\0" * 10, Geometry.from_hroi((0, 9, 0, 9)))
+
+
+def test_spot_measurement():
+    geometry = Geometry.from_hroi("100 131 200 231")
+    x, y, flux, background = SpotMeter(geometry).measure(spot(geometry, 212.3, 117.6))
+    assert background == pytest.approx(100, abs=1)
+    assert x == pytest.approx(212.3, abs=0.05)
+    assert y == pytest.approx(117.6, abs=0.05)
+    assert flux == pytest.approx(1000 * 4 * np.pi, rel=0.02)
+
+
+def test_pipeline_publishes_every_frame():
+    geometry = Geometry.from_hroi("0 15 0 15")
+    frames = [spot(geometry, 5 + i / 10, 7).tobytes() for i in range(20)]
+    results = []
+    pipeline = FramePipeline(geometry, publish=results.append, backlog=len(frames) + 1)
+    for i, frame in enumerate(frames):
+        pipeline.submit(i, frame)
+    pipeline.submit(20, b"short")
+    pipeline.close()
+    assert pipeline.measured == 20 and pipeline.errors == 1 and pipeline.dropped == 0
+    assert [r["seq"] for r in results] == list(range(1, 21))
+    assert results[-1]["x"] == pytest.approx(6.9, abs=0.05)
+    assert pipeline.latency.count == 20
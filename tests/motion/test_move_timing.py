@@ -0,0 +1,48 @@
+"""Tests for the learned move-duration model."""
+import pytest
+from hispec.motion import MoveTimingModel
+
+
+def test_default_prediction():
+    """Without history the configured velocity and settle are used."""
+    model = MoveTimingModel(velocity=2.0, settle=0.5)
+    assert model.predict("1", 4.0) == pytest.approx(2.5)
+    assert MoveTimingModel().predict("1", 4.0) is None
+
+
+def test_fit_recovers_velocity_and_settle():
+    """A linear duration history is fitted exactly."""
+    model = MoveTimingModel(forget=1.0)
+    for distance in (1.0, 2.0, 5.0, 10.0):
+        model.record("1", distance, 0.2 + distance / 4.0)
+    assert model.predict("1", 20.0) == pytest.approx(5.2)
+
+
+def test_directions_are_fitted_separately():
+    """Negative moves do not borrow the positive-direction fit."""
+    model = MoveTimingModel(velocity=1.0, forget=1.0)
+    for distance in (1.0, 2.0):
+        model.record("1", distance, distance / 10.0)
+    assert model.predict("1", -3.0) == pytest.approx(3.0)
+
+
+def test_active_move_lifecycle():
+    """start/wait track eta and record the finished move."""
+    model = MoveTimingModel(velocity=100.0)
+    assert model.eta("1") == 0.0
+    assert model.expected_duration("1") == 0.0
+    model.start("1", 1.0)
+    assert 0.0 <= model.eta("1") <= 0.01
+    assert model.wait("1", done=lambda: True, timeout=1.0)
+    assert model.eta("1") == 0.0
+    assert model.expected_duration("1") == pytest.approx(0.01)
+
+
+def test_wait_timeout_cancels():
+    """A move that never completes is not learned from."""
+    model = MoveTimingModel()
+    model.start("1", 1.0)
+    assert model.eta("1") == -1.0
+    assert not model.wait("1", done=lambda: False, timeout=0.1, poll=0.01)
+    assert model.eta("1") == 0.0
+    assert model.predict("1", 1.0) is None
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from hispec.multiplex import HIGH, LOW, ConnectionLost, RequestMultiplexer, RequestTimeout
+
+
+class NoReply(Exception):
+    """The fake device's receive timeout."""
+
+
+class FakeSerial:
+    """Echoes each command back as its reply, optionally slowly.
+
+    Commands in ``late`` are answered only after the receive has timed out;
+    their reply stays buffered until the connection is closed.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.connects = 0
+        self.sent = []
+        self.pending = []
+        self.fail_next = False
+        self.lock = threading.Lock()
+        self.busy = False
+        self.late = set()
+
+    def connect(self):
+        self.connects += 1
+
+    def disconnect(self):
+        self.pending = []
+
+    def send(self, command):
+        if self.fail_next:
+            self.fail_next = False
+            raise OSError("link down")
+        assert not self.busy, "exchanges interleaved"
+        self.busy = True
+        self.sent.append(command)
+        self.pending.append(command)
+
+    def receive(self, timeout=None):
+        time.sleep(self.delay)
+        self.busy = False
+        if self.pending[0] in self.late:
+            self.late.discard(self.pending[0])
+            raise NoReply(f"no reply within {timeout} s")
+        return "re:" + self.pending.pop(0)
+
+
+@pytest.fixture
+def serial():
+    return FakeSerial()
+
+
+@pytest.fixture
+def mux(serial):
+    m = RequestMultiplexer(serial, timeout=1.0, reconnect_delay=0.0)
+    m.start()
+    yield m
+    m.stop(timeout=1.0)
+
+
+def test_concurrent_requests_get_their_own_replies(mux):
+    results = {}
+
+    def worker(i):
+        results[i] = mux.request(f"Q{i}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: f"re:Q{i}" for i in range(20)}
+
+
+def test_priority_order(serial):
+    serial.delay = 0.05
+    mux = RequestMultiplexer(serial, timeout=2.0)
+    mux.start()
+    # Occupy the worker, then queue low before high
+    first = threading.Thread(target=mux.request, args=("busy",))
+    first.start()
+    time.sleep(0.01)
+    low = threading.Thread(target=mux.request, args=("low",), kwargs={"priority": LOW})
+    high = threading.Thread(target=mux.request, args=("high",), kwargs={"priority": HIGH})
+    low.start()
+    time.sleep(0.01)
+    high.start()
+    for t in (first, low, high):
+        t.join()
+    mux.stop(timeout=1.0)
+    assert serial.sent == ["busy", "high", "low"]
+
+
+def test_timeout_drops_queued_request(serial):
+    serial.delay = 0.2
+    mux = RequestMultiplexer(serial, timeout=1.0)
+    mux.start()
+    blocker = threading.Thread(target=mux.request, args=("slow",))
+    blocker.start()
+    time.sleep(0.01)
+    with pytest.raises(RequestTimeout):
+        mux.request("late", timeout=0.05)
+    blocker.join()
+    mux.stop(timeout=1.0)
+    assert "late" not in serial.sent
+
+
+def test_reconnects_after_failure(mux, serial):
+    assert mux.request("a") == "re:a"
+    serial.fail_next = True
+    with pytest.raises(ConnectionLost):
+        mux.request("b")
+    assert mux.request("c") == "re:c"
+    assert serial.connects == 2
+
+
+def test_no_reply_command(mux, serial):
+    assert mux.request("SET", reply=False) is None
+    assert serial.sent == ["SET"]
+
+
+def test_late_reply_does_not_answer_next_request(mux, serial):
+    serial.late = {"slow"}
+    with pytest.raises(NoReply):
+        mux.request("slow")
+    assert mux.request("next") == "re:next"
+    assert serial.connects == 2
@@ -0,0 +1,122 @@
+import io
+
+import numpy as np
+import pytest
+
+from hispec import perf
+
+
+@pytest.fixture
+def loop_times():
+    rng = np.random.default_rng(3)
+    x = rng.normal(1000.0, 5.0, 10001)
+    x[[100, 5000]] = [1500.0, 2000.0]
+    return x
+
+
+def test_describe_matches_numpy(loop_times):
+    stats = perf.describe(loop_times)
+    assert stats.count == len(loop_times)
+    assert stats.mean == pytest.approx(loop_times.mean())
+    assert stats.std == pytest.approx(loop_times.std())
+    assert stats.median == pytest.approx(np.median(loop_times))
+    assert stats.mad == pytest.approx(perf.mad(loop_times))
+    for q, value in stats.percentiles.items():
+        assert value == pytest.approx(np.percentile(loop_times, q))
+    assert stats.robust_std == pytest.approx(5.0, rel=0.05)
+
+
+@pytest.mark.parametrize("n", [1, 2, 5, 6])
+def test_mad_small(n):
+    x = np.array([3.0, 1.0, 4.0, 1.0, 5.0, 9.0][:n])
+    assert perf.describe(x).mad == pytest.approx(perf.mad(x))
+
+
+def test_sigma_clip(loop_times):
+    rejected = perf.sigma_clip(loop_times, sigma=8.0)
+    assert np.flatnonzero(rejected).tolist() == [100, 5000]
+    report = perf.outlier_report(loop_times, rejected, 8.0, limit=1)
+    assert "2 outliers" in report and "Ind: 5000" in report and "Ind: 100 " not in report
+
+
+def test_allan_white_noise():
+    rng = np.random.default_rng(4)
+    m, deviation = perf.allan_deviation(rng.normal(0.0, 2.0, 200000), m=[1, 4, 16, 64])
+    assert deviation == pytest.approx(2.0 / np.sqrt(m), rel=0.1)
+
+
+def test_jitter_of_regular_ticks():
+    t = 1000.0 * np.arange(1000)
+    t[500] += 3.0
+    metrics = perf.jitter(t)
+    assert metrics["peak_to_peak"] == pytest.approx(6.0)
+    assert metrics["tie_rms"] == pytest.approx(3.0 / np.sqrt(1000), rel=0.01)
+
+
+def test_compare_shift():
+    rng = np.random.default_rng(5)
+    a = rng.normal(0.0, 1.0, 50000)
+    result = perf.compare(a, a + 0.5)
+    assert result.shifts[50.0] == pytest.approx(0.5)
+    assert 0.15 < result.ks < 0.25
+    assert perf.compare(a, a).ks == 0.0
+
+
+def test_cli_converts_csv(tmp_path):
+    csv = tmp_path / "run.csv"
+    np.savetxt(csv, np.cumsum(np.full(100, 500000)), fmt="%d")
+    out = io.StringIO()
+    assert perf.main(["stats", str(csv)], out=out) == 0
+    assert "Samples: 99" in out.getvalue()
+    assert (tmp_path / "run.cols").is_dir()
+    assert perf.load_intervals(str(tmp_path / "run.cols"))[0] == pytest.approx(500.0)
+
+
+def test_fit_clock_offsets_and_drift():
+    rng = np.random.default_rng(3)
+    ticks = np.tile(np.arange(0, 10**7, 10**5, dtype=np.int64), 3)
+    groups = np.repeat(np.arange(3), 100)
+    starts = np.array([10**18, 10**18 + 5 * 10**9, 10**18 + 9 * 10**9])
+    host = starts[groups] + np.round(ticks * 10.00002 + rng.normal(0, 50, len(ticks))).astype(np.int64)
+    host[17] += 10**5       # one late sample
+    fit = perf.fit_clock(ticks, host, groups)
+    assert fit.drift_ppm(10.0) == pytest.approx(2.0, abs=0.1)
+    assert fit.rejected[17] and fit.rejected.sum() < 5
+    assert np.abs(fit.offsets - starts).max() < 100
+    assert fit.residuals[~fit.rejected].std() == pytest.approx(50, rel=0.2)
+
+
+def test_match_lag():
+    rng = np.random.default_rng(4)
+    read = np.cumsum(rng.uniform(900, 1100, 500))
+    received = read[7:] + 1e9 + rng.normal(0, 5, 493)
+    assert perf.match_lag(received, read) == 7
+    assert perf.match_lag(read, received) == -7
+
+
+def test_fit_frame_rate():
+    pixels = np.array([100, 400, 2500, 10000, 40000, 100, 2500])
+    exptime = np.array([0, 0, 0, 0, 0, 1e-3, 1e-3])
+    hz = 1.0 / (150e-6 + 40e-9 * pixels + exptime)
+    model = perf.fit_frame_rate(pixels, hz, exptime)
+    assert model.overhead == pytest.approx(150e-6)
+    assert model.per_pixel == pytest.approx(40e-9)
+    assert model.hz(900) == pytest.approx(1.0 / (150e-6 + 36e-6))
+    with pytest.raises(ValueError):
+        perf.fit_frame_rate([100, 100], [1000, 1000])
+
+
+def test_frame_rate_without_data_is_no_model():
+    with pytest.raises(ValueError):
+        perf.fit_frame_rate([100, 400, 2500], [np.nan, np.nan, np.nan])
+    model = perf.fit_frame_rate([100, 400, 2500], [np.nan, 5000.0, 2500.0])
+    assert np.isfinite(model.overhead) and np.isfinite(model.per_pixel)
+
+
+def test_frame_rate_regressions_flag_missing_rates():
+    model = perf.FrameRateModel(overhead=150e-6, per_pixel=40e-9, rms=0.0)
+    pixels = np.array([100, 2500, 10000, 40000])
+    hz = model.hz(pixels) * np.array([1.0, 0.9, np.nan, 0.99])
+    change, slow = model.regressions(pixels, hz, tolerance=0.05)
+    assert change[1] == pytest.approx(-0.1)
+    assert slow.tolist() == [False, True, True, False]
@@ -0,0 +1,51 @@
+import threading
+
+import numpy as np
+import pytest
+
+from hispec.columnar import ColumnWriter, load_columns
+from hispec.recorder import Recorder
+
+
+def test_records_spill_across_segments(tmp_path):
+    path = str(tmp_path / "soak.cols")
+    with Recorder(path, segment=16, segments=8) as rec:
+        for i in range(100):
+            rec.record(1000 * i, i % 7)
+    assert rec.count == 100 and rec.dropped == 0
+    zmq = load_columns(path)["zmq"]
+    assert zmq["timestamp"].tolist() == [1000 * i for i in range(100)]
+    assert zmq["size"].tolist() == [i % 7 for i in range(100)]
+
+
+def test_full_ring_drops_instead_of_blocking(tmp_path, monkeypatch):
+    release = threading.Event()
+    append = ColumnWriter.append
+
+    def stalled(self, table, **columns):
+        if table == "zmq":
+            release.wait()      # the disk is stuck until released
+        append(self, table, **columns)
+
+    monkeypatch.setattr(ColumnWriter, "append", stalled)
+    path = str(tmp_path / "soak.cols")
+    with Recorder(path, segment=4, segments=2) as rec:
+        for i in range(20):
+            rec.record(i, 1)
+        assert rec.count == 8 and rec.dropped == 12
+        release.set()
+    assert load_columns(path)["zmq"]["timestamp"].tolist() == list(range(8))
+
+
+def test_needs_two_segments(tmp_path):
+    with pytest.raises(ValueError):
+        Recorder(str(tmp_path / "soak.cols"), segments=1)
+
+
+def test_clock_marks(tmp_path):
+    path = str(tmp_path / "soak.cols")
+    with Recorder(path) as rec:
+        rec.record(1, 1)
+    clock = load_columns(path)["clock"]
+    assert len(clock["realtime"]) == 2
+    assert (np.diff(clock["monotonic"]) >= 0).all()
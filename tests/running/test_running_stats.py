@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from hispec.running import P2Quantile, RunningMoments, RunningSummary
+
+
+def test_moments_match_numpy():
+    rng = np.random.default_rng(1)
+    values = 1.0e6 + rng.normal(0.0, 3.0, 5000)
+    moments = RunningMoments()
+    for x in values[:1000]:
+        moments.add(x)
+    moments.extend(values[1000:3000])
+    other = RunningMoments()
+    other.extend(values[3000:])
+    moments.merge(other)
+    assert moments.count == len(values)
+    assert moments.mean == pytest.approx(values.mean())
+    assert moments.std == pytest.approx(values.std(), rel=1e-9)
+    assert (moments.min, moments.max) == (values.min(), values.max())
+
+
+def test_p2_quantiles():
+    rng = np.random.default_rng(2)
+    values = rng.exponential(1.0, 20000)
+    for p in (0.05, 0.5, 0.95, 0.99):
+        estimator = P2Quantile(p)
+        for x in values:
+            estimator.add(x)
+        assert estimator.value() == pytest.approx(np.quantile(values, p), rel=0.03)
+
+
+def test_p2_few_samples():
+    estimator = P2Quantile(0.5)
+    assert estimator.value() is None
+    for x in (3.0, 1.0, 2.0):
+        estimator.add(x)
+    assert estimator.value() == 2.0
+    with pytest.raises(ValueError):
+        P2Quantile(1.5)
+
+
+def test_summary():
+    summary = RunningSummary(quantiles=(0.9,))
+    summary.extend(np.arange(1001.0))
+    assert summary.count == 1001
+    assert summary.median == pytest.approx(500.0, rel=0.01)
+    assert summary.quantile(0.9) == pytest.approx(900.0, rel=0.01)
@@ -0,0 +1,77 @@
+import math
+
+import pytest
+
+from hispec.trend import ApproachTrend, ExponentialTrend, RingBuffer, SlidingRegression
+
+
+def test_slope_of_line():
+    fit = SlidingRegression(window=10.0)
+    for t in range(5):
+        fit.add(t, 3.0 + 0.5 * t)
+    assert fit.slope() == pytest.approx(0.5)
+    assert fit.value_at(10.0) == pytest.approx(8.0)
+
+
+def test_too_few_samples():
+    fit = SlidingRegression(window=10.0, min_samples=3)
+    fit.add(0.0, 1.0)
+    fit.add(1.0, 2.0)
+    assert fit.slope() is None
+
+
+def test_old_samples_leave_window():
+    fit = SlidingRegression(window=5.0)
+    # A steep ramp followed by a flat stretch longer than the window
+    for t in range(10):
+        fit.add(t, 10.0 * t)
+    for t in range(10, 30):
+        fit.add(t, 100.0)
+    assert len(fit) == 6
+    assert fit.slope() == pytest.approx(0.0, abs=1e-9)
+
+
+def test_rebase_keeps_fit():
+    fit = SlidingRegression(window=2.0)
+    for i in range(1000):
+        t = 1.0e6 + 0.1 * i
+        fit.add(t, 1.0e-3 * t)
+    assert fit.slope() == pytest.approx(1.0e-3, rel=1e-6)
+    assert fit.span() == pytest.approx(2.0, abs=0.11)
+
+
+def test_exponential_time_constant():
+    trend = ExponentialTrend(window=100.0)
+    for t in range(50):
+        trend.add(t, 1.0e-2 * math.exp(-t / 20.0))
+    assert trend.tau() == pytest.approx(20.0)
+
+    rising = ExponentialTrend(window=100.0)
+    for t in range(50):
+        rising.add(t, 1.0e-6 * math.exp(t / 40.0))
+    assert rising.tau() == pytest.approx(-40.0)
+
+
+def test_ring_buffer_wraps():
+    ring = RingBuffer(3)
+    for t in range(5):
+        ring.append(t, 10.0 * t)
+    assert len(ring) == 3
+    assert ring.back(0) == (4.0, 40.0)
+    assert ring.back(2) == (2.0, 20.0)
+    assert ring.to_array()[:, 0].tolist() == [2.0, 3.0, 4.0]
+
+
+def test_cooldown_eta():
+    trend = ApproachTrend(window=600.0, lag=5)
+    # Cooling from 290 K towards 70 K with a 1000 s time constant
+    for t in range(0, 600, 2):
+        trend.add(t, 70.0 + 220.0 * math.exp(-t / 1000.0))
+    asymptote, tau = trend.fit()
+    assert asymptote == pytest.approx(70.0, rel=1e-2)
+    assert tau == pytest.approx(1000.0, rel=1e-2)
+    now = 598
+    expected = 1000.0 * math.log((70.0 + 220.0 * math.exp(-now / 1000.0) - 70.0) / 30.0)
+    assert trend.eta(100.0) == pytest.approx(expected, rel=2e-2)
+    # Beyond the asymptote the target is never reached
+    assert trend.eta(50.0) is None